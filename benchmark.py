@@ -0,0 +1,233 @@
+"""Микробенчмарки горячих запросов Database.
+
+Заполняет временную базу синтетическими пользователями и ответами, замеряет
+check_if_answered, save_answer, get_all_users, get_user_statistics и
+get_all_final_answers по отдельности и под конкурентной нагрузкой asyncio,
+выводит p50/p99 и строк в секунду. Каждый размер прогоняется --repeats раз,
+в отчет идет лучший прогон: посторонняя нагрузка на машину замедляет
+вызовы, но не ускоряет их.
+
+При наличии базовых значений завершается с кодом 1, если p50 какого-либо
+замера вырос больше чем на --tolerance и больше чем на MIN_REGRESSION_SECONDS.
+Замеры [concurrent] только выводятся: их задержка в основном состоит из
+ожидания в цикле событий и меняется от запуска к запуску сильнее допуска.
+p99 проверяется только для замеров не менее чем из MIN_P99_SAMPLES вызовов
+(на меньшей выборке он совпадает с максимумом), поэтому по умолчанию
+(--iterations 200) не проверяется; включается через --iterations 1000.
+
+    python benchmark.py --sizes 10000 100000
+    python benchmark.py --sizes 10000 --save-baseline
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+from config import CAMPAIGN
+from database import Database
+
+BASELINE_FILE = 'benchmark_baseline.json'
+FINAL_QUESTION_ID = 6
+MIN_P99_SAMPLES = 1000
+# Рост задержки меньше этого считается шумом даже при превышении допуска
+MIN_REGRESSION_SECONDS = 0.002
+
+
+def percentile(values: List[float], p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def fill(db_name: str, users: int, seed: int = 0):
+    """Заполнение базы синтетическими данными через sqlite3 одной транзакцией"""
+    rnd = random.Random(seed)
+    conn = sqlite3.connect(db_name)
+    with conn:
+        conn.executemany(
+            'INSERT INTO users (user_id, full_name, office) VALUES (?, ?, ?)',
+            ((user_id, f'Тестов{user_id} Тест', f'Офис{user_id % 20}') for user_id in range(1, users + 1))
+        )
+
+        def answers():
+            for user_id in range(1, users + 1):
+                for question_id in range(1, FINAL_QUESTION_ID):
+                    if rnd.random() < 0.8:
+                        yield user_id, question_id, 'ответ', rnd.random() < 0.5, CAMPAIGN
+                if rnd.random() < 0.3:
+                    yield user_id, FINAL_QUESTION_ID, 'финальный ответ', None, CAMPAIGN
+
+        conn.executemany(
+            'INSERT INTO answers (user_id, question_id, answer, is_correct, campaign) VALUES (?, ?, ?, ?, ?)',
+            answers()
+        )
+    conn.close()
+
+
+class Benchmark:
+    def __init__(self, db: Database, users: int, iterations: int, scan_iterations: int, concurrency: int):
+        self.db = db
+        self.users = users
+        self.iterations = iterations
+        self.scan_iterations = scan_iterations
+        self.concurrency = concurrency
+        self.rnd = random.Random(1)
+
+    def _cases(self):
+        """Замеряемые вызовы: имя, фабрика корутины и признак полного прохода по таблице"""
+        rnd = self.rnd
+        return [
+            ('check_if_answered',
+             lambda: self.db.check_if_answered(rnd.randint(1, self.users), rnd.randint(1, FINAL_QUESTION_ID)),
+             False),
+            ('save_answer',
+             lambda: self.db.save_answer(rnd.randint(1, self.users), 999, 'бенчмарк', None),
+             False),
+            ('get_user_statistics',
+             lambda: self.db.get_user_statistics(rnd.randint(1, self.users)),
+             False),
+            ('get_all_users', self.db.get_all_users, True),
+            ('get_all_final_answers', self.db.get_all_final_answers, True),
+        ]
+
+    @staticmethod
+    def _rows(result) -> int:
+        return len(result) if isinstance(result, list) else 1
+
+    async def run(self) -> Dict[str, dict]:
+        results = {}
+        for name, call, is_scan in self._cases():
+            iterations = self.scan_iterations if is_scan else self.iterations
+            # Прогревочный вызов: первый проход читает страницы базы с диска
+            await call()
+
+            durations, rows = [], 0
+            for _ in range(iterations):
+                started = time.perf_counter()
+                rows += self._rows(await call())
+                durations.append(time.perf_counter() - started)
+            results[name] = self._summary(durations, rows, sum(durations))
+
+            # Конкурентная нагрузка: concurrency одновременных вызовов в цикле событий
+            durations, rows = [], 0
+
+            async def timed_call():
+                nonlocal rows
+                started = time.perf_counter()
+                rows += self._rows(await call())
+                durations.append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            for _ in range(max(1, iterations // self.concurrency)):
+                await asyncio.gather(*(timed_call() for _ in range(self.concurrency)))
+            results[f'{name}[concurrent]'] = self._summary(durations, rows, time.perf_counter() - started)
+        return results
+
+    @staticmethod
+    def _summary(durations: List[float], rows: int, wall: float) -> dict:
+        return {
+            'p50': percentile(durations, 0.5),
+            'p99': percentile(durations, 0.99),
+            'rows_per_second': rows / wall if wall else 0.0,
+            'samples': len(durations),
+        }
+
+
+def best_results(runs: List[Dict[str, dict]]) -> Dict[str, dict]:
+    """Лучшее значение каждого показателя по нескольким прогонам"""
+    return {
+        name: {
+            'p50': min(run[name]['p50'] for run in runs),
+            'p99': min(run[name]['p99'] for run in runs),
+            'rows_per_second': max(run[name]['rows_per_second'] for run in runs),
+            'samples': runs[0][name]['samples'],
+            'runs': len(runs),
+        }
+        for name in runs[0]
+    }
+
+
+def report(size: int, results: Dict[str, dict]):
+    print(f"\n=== {size} users ===")
+    print(f"{'case':<36}{'p50, ms':>12}{'p99, ms':>12}{'rows/s':>14}{'n':>8}")
+    for name, r in results.items():
+        print(f"{name:<36}{r['p50'] * 1000:>12.2f}{r['p99'] * 1000:>12.2f}{r['rows_per_second']:>14.0f}"
+              f"{r['samples']:>8}")
+
+
+def check_regressions(all_results: Dict[str, Dict[str, dict]], baseline: dict, tolerance: float) -> List[str]:
+    """Список замеров, p50 или p99 которых вырос больше допустимого относительно базовых значений.
+
+    Замеры [concurrent] не проверяются, см. описание модуля.
+    """
+    regressions = []
+    for size, results in all_results.items():
+        for name, r in results.items():
+            base = baseline.get(size, {}).get(name)
+            if not base or name.endswith('[concurrent]'):
+                continue
+            metrics = ['p50']
+            if min(r['samples'], base.get('samples', 0)) >= MIN_P99_SAMPLES:
+                metrics.append('p99')
+            for metric in metrics:
+                growth = r[metric] - base[metric]
+                if growth > base[metric] * tolerance and growth > MIN_REGRESSION_SECONDS:
+                    regressions.append(f"{size}/{name}: {metric} {r[metric] * 1000:.2f}ms > "
+                                       f"baseline {base[metric] * 1000:.2f}ms (+{tolerance:.0%})")
+    return regressions
+
+
+async def run_size(size: int, args) -> Dict[str, dict]:
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(os.path.join(tmp, 'bench.db'))
+        await db.init()
+        started = time.perf_counter()
+        fill(db.db_name, size)
+        print(f"Filled {size} users in {time.perf_counter() - started:.1f}s")
+        benchmark = Benchmark(db, size, args.iterations, args.scan_iterations, args.concurrency)
+        return best_results([await benchmark.run() for _ in range(args.repeats)])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000],
+                        help='размеры базы (количество пользователей), например 10000 100000 1000000')
+    parser.add_argument('--iterations', type=int, default=200, help='вызовов точечных запросов')
+    parser.add_argument('--scan-iterations', type=int, default=50, help='вызовов запросов с полным проходом')
+    parser.add_argument('--concurrency', type=int, default=20, help='одновременных вызовов')
+    parser.add_argument('--repeats', type=int, default=5, help='прогонов каждого размера, берется лучший')
+    parser.add_argument('--baseline', default=BASELINE_FILE, help='файл с базовыми значениями')
+    parser.add_argument('--save-baseline', action='store_true', help='сохранить результаты как базовые')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='допустимый рост p50 и p99')
+    args = parser.parse_args()
+
+    all_results = {}
+    for size in args.sizes:
+        results = asyncio.run(run_size(size, args))
+        report(size, results)
+        all_results[str(size)] = results
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(all_results, f, indent=2)
+        print(f"\nBaseline saved to {args.baseline}")
+        return
+
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            regressions = check_regressions(all_results, json.load(f), args.tolerance)
+        if regressions:
+            print("\nPerformance regressions:")
+            for line in regressions:
+                print(f"- {line}")
+            sys.exit(1)
+        print("\nNo regressions against baseline")
+
+
+if __name__ == '__main__':
+    main()
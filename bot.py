@@ -1,26 +1,43 @@
 from aiogram import Bot, Dispatcher, types
-from aiogram.contrib.fsm_storage.memory import MemoryStorage
+from aiogram.contrib.fsm_storage.files import JSONStorage
 from aiogram.dispatcher import FSMContext
 from aiogram.dispatcher.filters.state import State, StatesGroup
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove
 from telegram import InlineKeyboardMarkup, InlineKeyboardButton
-from config import BOT_TOKEN, ADMIN_IDS
+from aiogram.bot.api import TelegramAPIServer, TELEGRAM_PRODUCTION
+from config import BOT_TOKEN, ADMIN_IDS, API_SERVER_URL, METRICS_HOST, METRICS_PORT, FSM_STORAGE_PATH
 from database import Database
+from lifecycle import Lifecycle
 from logger import MessageLogger
+from media import MediaStore, collect_media_paths
+from metrics import InstrumentedBot, timed, start_metrics_server, HANDLER_SECONDS, HANDLER_ERRORS
 from questions import QUESTIONS, INFO_POSTS, reset_times
-from utils import notify_admin, get_moscow_time, is_admin
+from registry import RecipientRegistry
+from roster import Roster
+from utils import (notify_admin, get_moscow_time, is_admin, find_active_question, message_timestamp,
+                   callback_timestamp, ReceiptTimeMiddleware)
 from scheduler import Scheduler
+from sharding import ShardedDispatcher, update_user_id
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 import logging
 import asyncio
+import time
 from datetime import datetime
-scheduler_task = None
+from typing import Optional
 # Инициализация бота
-bot = Bot(token=BOT_TOKEN)
-storage = MemoryStorage()
-dp = Dispatcher(bot, storage=storage)
+bot = InstrumentedBot(
+    token=BOT_TOKEN,
+    server=TelegramAPIServer.from_base(API_SERVER_URL) if API_SERVER_URL else TELEGRAM_PRODUCTION
+)
+# Состояния диалогов хранятся в памяти и сохраняются в файл при остановке бота
+storage = JSONStorage(FSM_STORAGE_PATH)
+dp = ShardedDispatcher(bot, storage=storage)
 db = Database()
 logger = MessageLogger()
+media = MediaStore()
+registry = RecipientRegistry()
+roster = Roster()
+dp.middleware.setup(ReceiptTimeMiddleware())
 
 # Словарь для хранения времени последнего запроса подсказки
 last_hint_request = {}
@@ -39,14 +56,31 @@ def create_options_keyboard(options: list) -> InlineKeyboardMarkup:
         keyboard.append([InlineKeyboardButton(text=option, callback_data=option)])
     return InlineKeyboardMarkup(keyboard)
 
+def check_answer(question_id: int, question: dict, user_answer: str) -> Optional[bool]:
+    """Проверка ответа; для финального вопроса правильность не определяется"""
+    if question_id == 6:
+        return None
+    return user_answer == question['correct_answer']
+
+async def send_answer_result(message: types.Message, question_id: int, question: dict, is_correct: Optional[bool]):
+    """Ответ пользователю после сохранения его ответа"""
+    if question_id == 6:
+        await message.answer("Ответ принят! Результаты будут объявлены 12 февраля.")
+    elif is_correct:
+        await message.answer(question['correct_answer_text'])
+        if 'image_correct' in question:
+            await media.send(message.answer_photo, question['image_correct'])
+    else:
+        await message.answer(question['wrong_answer_text'])
+
 @dp.message_handler(commands=['start'])
+@timed(HANDLER_SECONDS, HANDLER_ERRORS)
 async def cmd_start(message: types.Message):
     await logger.log_message(message)
     try:
         # Отправляем приветственную картинку
         try:
-            with open('welcomepicture.jpg', 'rb') as photo:
-                await message.answer_photo(photo)
+            await media.send(message.answer_photo, 'welcomepicture.jpg')
         except Exception as e:
             logging.error(f"Failed to send welcome image: {e}")
 
@@ -69,6 +103,7 @@ async def cmd_start(message: types.Message):
         await QuizStates.registration.set()
 
 @dp.message_handler(commands=['rules'], state='*')  # state='*' означает, что команда будет работать в любом состоянии
+@timed(HANDLER_SECONDS, HANDLER_ERRORS)
 async def cmd_rules(message: types.Message, state: FSMContext):  # добавляем state в параметры
     await logger.log_message(message)
 
@@ -81,15 +116,20 @@ async def cmd_rules(message: types.Message, state: FSMContext):  # добавл
     await message.answer(rules_text)
 
 @dp.message_handler(commands=['admin'],  state='*')
+@timed(HANDLER_SECONDS, HANDLER_ERRORS)
 async def cmd_admin(message: types.Message):
-    """Административная команда для получения статистики"""
+    """Административная команда для получения статистики (/admin [кампания])"""
     if not is_admin(message.from_user.id):
         return
 
+    campaign = message.get_args() or None
+    if campaign and not db.is_valid_campaign(campaign):
+        await message.answer(f"Недопустимое имя кампании: {campaign}")
+        return
+
     try:
-        users = await db.get_all_users()
-        total_users = len(users)
-        final_answers = await db.get_all_final_answers()
+        total_users = len(registry)
+        final_answers = await db.get_all_final_answers(campaign)
         total_final = len(final_answers)
 
         stats = f"""📊 Статистика квиза:
@@ -109,7 +149,47 @@ async def cmd_admin(message: types.Message):
         logging.error(error_msg)
         await message.answer("Произошла ошибка при получении статистики")
 
+@dp.message_handler(commands=['archive'], state='*')
+@timed(HANDLER_SECONDS, HANDLER_ERRORS)
+async def cmd_archive(message: types.Message):
+    """Перенос ответов завершенной кампании в архив (/archive кампания)"""
+    if not is_admin(message.from_user.id):
+        return
+
+    campaign = message.get_args()
+    if not campaign:
+        await message.answer("Укажите кампанию: /archive <кампания>")
+        return
+    if not db.is_valid_campaign(campaign):
+        await message.answer(f"Недопустимое имя кампании: {campaign}")
+        return
+
+    try:
+        moved = await db.archive_campaign(campaign)
+        await message.answer(f"Кампания {campaign} перенесена в архив, ответов: {moved}")
+    except ValueError:
+        await message.answer(f"Кампания {campaign} еще активна и не может быть перенесена в архив")
+    except Exception as e:
+        error_msg = f"Error archiving campaign {campaign}: {e}"
+        logging.error(error_msg)
+        await message.answer("Произошла ошибка при переносе кампании в архив")
+
+@dp.message_handler(commands=['reload_roster'], state='*')
+@timed(HANDLER_SECONDS, HANDLER_ERRORS)
+async def cmd_reload_roster(message: types.Message):
+    """Перечитывание списка сотрудников после импорта через roster.py"""
+    if not is_admin(message.from_user.id):
+        return
+
+    try:
+        await roster.load(db)
+        await message.answer("Список сотрудников обновлен" if roster else "Список сотрудников пуст")
+    except Exception as e:
+        logging.error(f"Error reloading roster: {e}")
+        await message.answer("Произошла ошибка при загрузке списка сотрудников")
+
 @dp.message_handler(state=QuizStates.registration)
+@timed(HANDLER_SECONDS, HANDLER_ERRORS)
 async def process_registration(message: types.Message, state: FSMContext):
     await logger.log_message(message)
 
@@ -118,26 +198,28 @@ async def process_registration(message: types.Message, state: FSMContext):
         full_name = " ".join(user_data[:-1])
         office = user_data[-1]
 
+        if roster:
+            # Имя и офис берем в написании из списка сотрудников
+            employee = roster.match(message.text)
+            if employee is None:
+                await message.answer("Не удалось найти вас в списке сотрудников. "
+                                     "Проверьте написание и введите Фамилию, Имя и офис еще раз")
+                return
+            full_name, office = employee
+
         try:
             await db.register_user(
                 user_id=message.from_user.id,
                 full_name=full_name,
                 office=office
             )
+            registry.add_user(message.from_user.id, office)
             await message.answer("Регистрация успешна!")
             await state.finish()
             await QuizStates.answering.set()
 
             # Проверяем, есть ли активный вопрос
-            current_time = get_moscow_time()
-            active_question = None
-            question_id = None
-
-            for qid, question in QUESTIONS.items():
-                if question['start_time'] <= current_time <= question['end_time']:
-                    active_question = question
-                    question_id = qid
-                    break
+            question_id, active_question = find_active_question(QUESTIONS, message_timestamp(message))
 
             if active_question:
                 if await db.check_if_answered(message.from_user.id, question_id):
@@ -146,18 +228,19 @@ async def process_registration(message: types.Message, state: FSMContext):
 
                 # Отправляем активный вопрос
                 if 'question_image' in active_question:
-                    with open(active_question['question_image'], 'rb') as photo:
-                        await message.answer_photo(photo, caption=active_question['text'])
+                    await media.send(message.answer_photo, active_question['question_image'],
+                                     caption=active_question['text'])
                 elif 'video_path' in active_question:
-                    with open(active_question['video_path'], 'rb') as video:
-                        await message.answer_video(video, caption=active_question['text'])
+                    await media.send(message.answer_video, active_question['video_path'],
+                                     caption=active_question['text'])
                 else:
                     await message.answer(active_question['text'])
 
                 # Если есть варианты ответов, отправляем их
                 if 'options' in active_question:
                     keyboard = create_options_keyboard(active_question['options'])
-                    await message.answer("Выберите ваш ответ:", reply_markup=keyboard)
+                    sent = await message.answer("Выберите ваш ответ:", reply_markup=keyboard)
+                    await db.save_keyboards([(message.from_user.id, question_id, sent.message_id)])
                 else:
                     await message.answer("Введите ваш ответ:", reply_markup=ReplyKeyboardRemove())
 
@@ -179,6 +262,7 @@ async def process_registration(message: types.Message, state: FSMContext):
         await message.answer("Пожалуйста, введите ФИО и офис через пробел")
 
 @dp.message_handler(commands=['hint'], state='*')
+@timed(HANDLER_SECONDS, HANDLER_ERRORS)
 async def cmd_hint(message: types.Message):
     await logger.log_message(message)
 
@@ -204,31 +288,22 @@ async def cmd_hint(message: types.Message):
 
 
 @dp.callback_query_handler(state=QuizStates.answering)
+@timed(HANDLER_SECONDS, HANDLER_ERRORS)
 async def process_callback_answer(callback_query: types.CallbackQuery, state: FSMContext):
     await logger.log_message(callback_query.message)
 
-    # Сразу отвечаем на callback query
-    await callback_query.answer()
+    # Находим вопрос, открытый в момент получения нажатия. Нажатие на кнопку
+    # закрытого вопроса отклоняем всплывающим ответом без обращения к базе
+    question_id, active_question = find_active_question(QUESTIONS, callback_timestamp())
+    if not active_question or callback_query.data not in active_question.get('options', ()):
+        await callback_query.answer("Прием ответов на этот вопрос завершен")
+        return
 
-    current_time = get_moscow_time()
-    active_question = None
-    question_id = None
+    await callback_query.answer()
 
-    # Остальной код функции...
     try:
-        # Находим активный вопрос
-        for qid, question in QUESTIONS.items():
-            if question['start_time'] <= current_time <= question['end_time']:
-                active_question = question
-                question_id = qid
-                break
-
-        if not active_question:
-            await callback_query.message.answer("В данный момент нет активных вопросов!")
-            return
-
-        # Проверяем, не отвечал ли уже пользователь на этот вопрос
-        if await db.check_if_answered(callback_query.from_user.id, question_id):
+        # Проверяем по реестру, не отвечал ли уже пользователь на этот вопрос
+        if registry.has_answered(callback_query.from_user.id, question_id):
             next_question = None
             next_time = None
             for qid, q in QUESTIONS.items():
@@ -255,17 +330,18 @@ async def process_callback_answer(callback_query: types.CallbackQuery, state: FS
             answer=user_answer,
             is_correct=is_correct
         )
+        registry.mark_answered(callback_query.from_user.id, question_id)
 
         if is_correct:
             await callback_query.message.answer(active_question['correct_answer_text'])
             if 'image_correct' in active_question:
-                with open(active_question['image_correct'], 'rb') as photo:
-                    await callback_query.message.answer_photo(photo)
+                await media.send(callback_query.message.answer_photo, active_question['image_correct'])
         else:
             await callback_query.message.answer(active_question['wrong_answer_text'])
 
-        # Удаляем клавиатуру после ответа
+        # Удаляем клавиатуру после ответа, снимать ее при закрытии вопроса уже не нужно
         await callback_query.message.edit_reply_markup(reply_markup=None)
+        await db.delete_keyboards(question_id, [callback_query.from_user.id])
 
     except Exception as e:
         error_msg = f"Error processing callback answer: {e}"
@@ -274,21 +350,14 @@ async def process_callback_answer(callback_query: types.CallbackQuery, state: FS
         await notify_admin(bot, f"Ошибка при обработке ответа от {callback_query.from_user.id}: {e}")
 
 @dp.message_handler(lambda message: not message.text.startswith('/'), state=QuizStates.answering)
+@timed(HANDLER_SECONDS, HANDLER_ERRORS)
 async def process_answer(message: types.Message):
 
 
     await logger.log_message(message)
 
-    current_time = get_moscow_time()
-    active_question = None
-    question_id = None
-
-    # Находим активный вопрос
-    for qid, question in QUESTIONS.items():
-        if question['start_time'] <= current_time <= question['end_time']:
-            active_question = question
-            question_id = qid
-            break
+    # Находим вопрос, открытый в момент отправки сообщения
+    question_id, active_question = find_active_question(QUESTIONS, message_timestamp(message))
 
     if not active_question:
         await message.answer("В данный момент нет активных вопросов!")
@@ -314,33 +383,15 @@ async def process_answer(message: types.Message):
     user_answer = message.text.lower().strip()
 
     try:
-        # Если это финальный вопрос (6-й)
-        if question_id == 6:
-            await db.save_answer(
-                user_id=message.from_user.id,
-                question_id=question_id,
-                answer=user_answer,
-                is_correct=None  # для финального вопроса не определяем правильность
-            )
-            await message.answer("Ответ принят! Результаты будут объявлены 12 февраля.")
-            return
-
-        # Для остальных вопросов проверяем правильность
-        is_correct = user_answer == active_question['correct_answer']
+        is_correct = check_answer(question_id, active_question, user_answer)
         await db.save_answer(
             user_id=message.from_user.id,
             question_id=question_id,
             answer=user_answer,
             is_correct=is_correct
         )
-
-        if is_correct:
-            await message.answer(active_question['correct_answer_text'])
-            if 'image_correct' in active_question:
-                with open(active_question['image_correct'], 'rb') as photo:
-                    await message.answer_photo(photo)
-        else:
-            await message.answer(active_question['wrong_answer_text'])
+        registry.mark_answered(message.from_user.id, question_id)
+        await send_answer_result(message, question_id, active_question, is_correct)
 
     except Exception as e:
         error_msg = f"Error processing answer: {e}"
@@ -349,36 +400,130 @@ async def process_answer(message: types.Message):
         await notify_admin(bot, f"Ошибка при обработке ответа от {message.from_user.id}: {e}")
 
 
+async def drain_backlog():
+    """Быстрая обработка обновлений, накопившихся, пока бот был остановлен.
+
+    Текстовые ответы пользователей в состоянии answering проверяются по
+    времени отправки и сохраняются одной транзакцией. Остальные обновления,
+    повторные ответы и все обновления пользователей, нажимавших кнопки,
+    передаются диспетчеру по порядку.
+    """
+    Bot.set_current(bot)
+    Dispatcher.set_current(dp)
+
+    # Все накопившиеся обновления получены не позже начала чтения очереди
+    received_at = time.time()
+    updates = []
+    offset = None
+    while True:
+        batch = await bot.get_updates(offset=offset, limit=100, timeout=0)
+        if not batch:
+            break
+        updates.extend(batch)
+        offset = batch[-1].update_id + 1
+    if not updates:
+        return
+    logging.info(f"Draining {len(updates)} pending updates")
+
+    answered = {}
+    accepted = []
+    rest = []
+    # После /start пользователь снова проходит регистрацию через диспетчер
+    restarted = {update.message.from_user.id for update in updates
+                 if update.message and update.message.is_command() and update.message.get_command() == '/start'}
+    # Нажатия на кнопки идут через диспетчер; чтобы ответ текстом не обогнал
+    # более раннее нажатие, все обновления такого пользователя идут туда же по порядку
+    tapped = {update.callback_query.from_user.id for update in updates if update.callback_query}
+
+    # Состояния сохраняются в файл только при корректной остановке. При первом
+    # запуске и после аварийной остановки состояния нет — зарегистрированные
+    # пользователи продолжают отвечать на вопросы
+    backlog_users = {update_user_id(update) for update in updates} - restarted
+    for user_id in backlog_users:
+        if user_id in registry and await dp.storage.get_state(chat=user_id, user=user_id) is None:
+            await dp.storage.set_state(chat=user_id, user=user_id, state=QuizStates.answering.state)
+
+    for update in updates:
+        message = update.message
+        user_id = message.from_user.id if message else None
+        if (not message or not message.text or message.is_command()
+                or user_id not in registry or user_id in restarted or user_id in tapped):
+            rest.append(update)
+            continue
+        # Например, после /start пользователь в состоянии registration, и его текст — не ответ
+        if await dp.storage.get_state(chat=user_id, user=user_id) != QuizStates.answering.state:
+            rest.append(update)
+            continue
+
+        question_id, question = find_active_question(QUESTIONS, message_timestamp(message))
+        if not question:
+            rest.append(update)
+            continue
+        if question_id not in answered:
+            answered[question_id] = await db.get_answered_user_ids(question_id)
+        if user_id in answered[question_id]:
+            # Повторный ответ обработает обычный обработчик
+            rest.append(update)
+            continue
+
+        answered[question_id].add(user_id)
+        user_answer = message.text.lower().strip()
+        accepted.append((message, question_id, question, user_answer,
+                         check_answer(question_id, question, user_answer)))
+
+    if accepted:
+        await db.save_answers([(m.from_user.id, qid, answer, ok) for m, qid, _, answer, ok in accepted])
+        for message, question_id, *_ in accepted:
+            registry.mark_answered(message.from_user.id, question_id)
+        logging.info(f"Saved {len(accepted)} answers from backlog")
+
+    for message, question_id, question, _, is_correct in accepted:
+        try:
+            await logger.log_message(message)
+            await send_answer_result(message, question_id, question, is_correct)
+        except Exception as e:
+            logging.error(f"Error replying to backlog answer from {message.from_user.id}: {e}")
+
+    # Очереди пользователей сохраняют порядок обновлений каждого пользователя
+    await dp.process_updates(rest, received_at=received_at)
+
+
 async def main():
     try:
-        global scheduler_task  # Добавьте эту строку
-
         # Настройка базового логирования
         logging.basicConfig(
             level=logging.INFO,
             format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
         )
 
+        # HTTP-эндпоинт с метриками
+        metrics_runner = await start_metrics_server(METRICS_HOST, METRICS_PORT)
+
         # Инициализация базы данных
         await db.init()
+        await registry.load(db)
+        await roster.load(db)
 
         # Сброс времен вопросов при запуске
         logging.info("Resetting question times...")
         reset_times()
 
+        # Загрузка медиафайлов в память
+        await media.preload(collect_media_paths(QUESTIONS, INFO_POSTS))
+
+        # Обрабатываем обновления, накопившиеся за время простоя
+        await drain_backlog()
+
         # Уведомляем админов о запуске бота
         await notify_admin(bot, "🚀 Бот запущен и готов к работе")
 
-        # Запуск планировщика
+        # Запуск планировщика и бота до сигнала остановки
         logging.info("Creating scheduler...")
-        scheduler = Scheduler(bot, db)
-        logging.info("Starting scheduler...")
-        scheduler_task = asyncio.create_task(scheduler.start())  # Сохраняем задачу в глобальную переменную
-        logging.info("Scheduler task created")
-
-        # Запуск бота
-        logging.info("Starting polling...")
-        await dp.start_polling()
+        scheduler = Scheduler(bot, db, media, registry)
+        lifecycle = Lifecycle(bot, dp, scheduler, metrics_runner)
+        lifecycle.install_signal_handlers()
+        logging.info("Starting scheduler and polling...")
+        await lifecycle.run()
 
     except Exception as e:
         logging.error(f"Critical error: {e}", exc_info=True)
@@ -1,6 +1,36 @@
 BOT_TOKEN = "bot token"
 ADMIN_IDS = [123123]  # Список ID администраторов
+API_SERVER_URL = None  # Адрес альтернативного Bot API сервера, None — api.telegram.org
+
+# Идентификатор текущей кампании квиза и каталог архивов завершенных кампаний
+CAMPAIGN = '2025-chinese-new-year'
+ARCHIVE_DIR = 'archive'
 
 # Настройки временных зон и форматов
 TIMEZONE = 'Europe/Moscow'
 DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Файлы меньше этого размера (в байтах) загружаются в память при запуске
+MEDIA_PRELOAD_LIMIT = 2 * 1024 * 1024
+
+# Адрес HTTP-эндпоинта с метриками в формате Prometheus
+METRICS_HOST = '127.0.0.1'
+METRICS_PORT = 9108
+
+# Обработка обновлений: параллельных обработчиков, размер очереди одного пользователя
+# и общее число ожидающих обработки обновлений
+DISPATCH_WORKERS = 64
+DISPATCH_USER_QUEUE_SIZE = 20
+DISPATCH_MAX_PENDING = 10000
+
+# Снятие клавиатур после закрытия вопроса, запросов к Bot API в секунду
+CLOSE_OUT_RATE = 20
+
+# Рассылки: через сколько получателей записывать в базу отправленные клавиатуры и прогресс
+BROADCAST_BATCH_SIZE = 500
+
+# Сколько секунд после SIGTERM ждать завершения обработчиков и рассылок
+SHUTDOWN_TIMEOUT = 25
+
+# Файл, в который при остановке сохраняются состояния диалогов с пользователями
+FSM_STORAGE_PATH = 'fsm_state.json'
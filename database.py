@@ -1,44 +1,43 @@
 import aiosqlite
 import logging
+import os
+import re
 from datetime import datetime
-from typing import List, Optional, Tuple
+from typing import List, Optional, Set, Tuple
+from config import CAMPAIGN, ARCHIVE_DIR
+from metrics import timed, DB_QUERY_SECONDS, DB_ERRORS
+from migrations import apply_migrations
 
 class Database:
-    def __init__(self, db_name: str = 'quiz.db'):
+    def __init__(self, db_name: str = 'quiz.db', campaign: str = CAMPAIGN, archive_dir: str = ARCHIVE_DIR):
         self.db_name = db_name
+        self.campaign = campaign
+        self.archive_dir = archive_dir
+
+    @staticmethod
+    def is_valid_campaign(campaign: str) -> bool:
+        """Имя кампании из букв, цифр, точек, дефисов и подчеркиваний, без «..»"""
+        return re.fullmatch(r'[\w.-]+', campaign) is not None and '..' not in campaign
+
+    def archive_path(self, campaign: str) -> str:
+        """Путь к файлу архива кампании; имя приходит из команд администратора"""
+        if not self.is_valid_campaign(campaign):
+            raise ValueError(f"Invalid campaign name: {campaign!r}")
+        return os.path.join(self.archive_dir, f'{campaign}.db')
 
     async def init(self):
-        """Инициализация базы данных"""
+        """Инициализация базы данных и применение миграций схемы"""
         try:
             async with aiosqlite.connect(self.db_name) as db:
-                # Создаем таблицу пользователей
-                await db.execute('''
-                    CREATE TABLE IF NOT EXISTS users (
-                        user_id INTEGER PRIMARY KEY,
-                        full_name TEXT NOT NULL,
-                        office TEXT NOT NULL,
-                        registration_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                ''')
-
-                # Создаем таблицу ответов
-                await db.execute('''
-                    CREATE TABLE IF NOT EXISTS answers (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        user_id INTEGER,
-                        question_id INTEGER,
-                        answer TEXT,
-                        is_correct BOOLEAN,
-                        answer_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        FOREIGN KEY (user_id) REFERENCES users (user_id)
-                    )
-                ''')
-
-                await db.commit()
+                # WAL позволяет читать базу во время записи и построения индексов
+                await db.execute('PRAGMA journal_mode=WAL')
+                version = await apply_migrations(db)
+                logging.info(f"Database schema version: {version}")
         except Exception as e:
             logging.error(f"Database initialization error: {e}")
             raise
 
+    @timed(DB_QUERY_SECONDS, DB_ERRORS)
     async def register_user(self, user_id: int, full_name: str, office: str):
         """Регистрация нового пользователя"""
         try:
@@ -52,6 +51,34 @@ class Database:
             logging.error(f"Error registering user {user_id}: {e}")
             raise
 
+    @timed(DB_QUERY_SECONDS, DB_ERRORS)
+    async def import_roster(self, employees: List[Tuple[str, str, str]]) -> int:
+        """Замена списка сотрудников (full_name, name_key, office) одной транзакцией"""
+        try:
+            async with aiosqlite.connect(self.db_name) as db:
+                await db.execute('DELETE FROM roster')
+                await db.executemany(
+                    'INSERT INTO roster (full_name, name_key, office) VALUES (?, ?, ?)',
+                    employees
+                )
+                await db.commit()
+                return len(employees)
+        except Exception as e:
+            logging.error(f"Error importing roster: {e}")
+            raise
+
+    @timed(DB_QUERY_SECONDS, DB_ERRORS)
+    async def get_roster(self) -> List[Tuple[str, str, str]]:
+        """Список сотрудников (full_name, name_key, office)"""
+        try:
+            async with aiosqlite.connect(self.db_name) as db:
+                async with db.execute('SELECT full_name, name_key, office FROM roster') as cursor:
+                    return await cursor.fetchall()
+        except Exception as e:
+            logging.error(f"Error getting roster: {e}")
+            raise
+
+    @timed(DB_QUERY_SECONDS, DB_ERRORS)
     async def get_all_users(self) -> List[int]:
         """Получение списка всех пользователей"""
         try:
@@ -60,35 +87,168 @@ class Database:
                     return [row[0] async for row in cursor]
         except Exception as e:
             logging.error(f"Error getting users list: {e}")
+            # Исключение здесь не доходит до timed, поэтому ошибка считается вручную
+            DB_ERRORS.inc('get_all_users')
             return []
 
+    @timed(DB_QUERY_SECONDS, DB_ERRORS)
+    async def get_recipients(self) -> List[Tuple[int, str]]:
+        """Пользователи и их офисы, отсортированные по user_id"""
+        try:
+            async with aiosqlite.connect(self.db_name) as db:
+                async with db.execute('SELECT user_id, office FROM users ORDER BY user_id') as cursor:
+                    return await cursor.fetchall()
+        except Exception as e:
+            logging.error(f"Error getting recipients: {e}")
+            raise
+
+    @timed(DB_QUERY_SECONDS, DB_ERRORS)
+    async def get_answered_pairs(self) -> List[Tuple[int, int]]:
+        """Пары (question_id, user_id) ответов текущей кампании, отсортированные"""
+        try:
+            async with aiosqlite.connect(self.db_name) as db:
+                async with db.execute(
+                    '''SELECT DISTINCT question_id, user_id FROM answers
+                       WHERE campaign = ? ORDER BY question_id, user_id''',
+                    (self.campaign,)
+                ) as cursor:
+                    return await cursor.fetchall()
+        except Exception as e:
+            logging.error(f"Error getting answered users: {e}")
+            raise
+
+    @timed(DB_QUERY_SECONDS, DB_ERRORS)
     async def save_answer(self, user_id: int, question_id: int, answer: str, is_correct: Optional[bool]):
         """Сохранение ответа пользователя"""
         try:
             async with aiosqlite.connect(self.db_name) as db:
                 await db.execute(
-                    'INSERT INTO answers (user_id, question_id, answer, is_correct) VALUES (?, ?, ?, ?)',
-                    (user_id, question_id, answer, is_correct)
+                    'INSERT INTO answers (user_id, question_id, answer, is_correct, campaign) VALUES (?, ?, ?, ?, ?)',
+                    (user_id, question_id, answer, is_correct, self.campaign)
                 )
                 await db.commit()
         except Exception as e:
             logging.error(f"Error saving answer for user {user_id}: {e}")
             raise
 
+    @timed(DB_QUERY_SECONDS, DB_ERRORS)
+    async def save_answers(self, answers: List[Tuple[int, int, str, Optional[bool]]]):
+        """Сохранение пачки ответов (user_id, question_id, answer, is_correct) одной транзакцией"""
+        try:
+            async with aiosqlite.connect(self.db_name) as db:
+                await db.executemany(
+                    'INSERT INTO answers (user_id, question_id, answer, is_correct, campaign) VALUES (?, ?, ?, ?, ?)',
+                    [(*answer, self.campaign) for answer in answers]
+                )
+                await db.commit()
+        except Exception as e:
+            logging.error(f"Error saving {len(answers)} answers: {e}")
+            raise
+
+    @timed(DB_QUERY_SECONDS, DB_ERRORS)
+    async def get_answered_user_ids(self, question_id: int) -> Set[int]:
+        """Множество пользователей, уже ответивших на вопрос"""
+        try:
+            async with aiosqlite.connect(self.db_name) as db:
+                async with db.execute(
+                    'SELECT DISTINCT user_id FROM answers WHERE campaign = ? AND question_id = ?',
+                    (self.campaign, question_id)
+                ) as cursor:
+                    return {row[0] async for row in cursor}
+        except Exception as e:
+            logging.error(f"Error getting users answered question {question_id}: {e}")
+            raise
+
+    @timed(DB_QUERY_SECONDS, DB_ERRORS)
     async def check_if_answered(self, user_id: int, question_id: int) -> bool:
         """Проверка, отвечал ли пользователь на вопрос"""
         try:
             async with aiosqlite.connect(self.db_name) as db:
                 async with db.execute(
-                        'SELECT COUNT(*) FROM answers WHERE user_id = ? AND question_id = ?',
-                        (user_id, question_id)
+                        'SELECT COUNT(*) FROM answers WHERE campaign = ? AND user_id = ? AND question_id = ?',
+                        (self.campaign, user_id, question_id)
                 ) as cursor:
                     result = await cursor.fetchone()
                     return result[0] > 0
         except Exception as e:
             logging.error(f"Error checking answer for user {user_id}: {e}")
+            DB_ERRORS.inc('check_if_answered')
             return False
 
+    @timed(DB_QUERY_SECONDS, DB_ERRORS)
+    async def save_keyboards(self, keyboards: List[Tuple[int, int, int]]):
+        """Сохранение пачки отправленных клавиатур (user_id, question_id, message_id) одной транзакцией"""
+        try:
+            async with aiosqlite.connect(self.db_name) as db:
+                await db.executemany(
+                    '''INSERT OR REPLACE INTO keyboards (campaign, user_id, question_id, message_id)
+                       VALUES (?, ?, ?, ?)''',
+                    [(self.campaign, *keyboard) for keyboard in keyboards]
+                )
+                await db.commit()
+        except Exception as e:
+            logging.error(f"Error saving {len(keyboards)} keyboards: {e}")
+            raise
+
+    @timed(DB_QUERY_SECONDS, DB_ERRORS)
+    async def get_keyboards(self, question_id: int) -> List[Tuple[int, int]]:
+        """Клавиатуры вопроса, которые еще не сняты: (user_id, message_id)"""
+        try:
+            async with aiosqlite.connect(self.db_name) as db:
+                async with db.execute(
+                    'SELECT user_id, message_id FROM keyboards WHERE campaign = ? AND question_id = ? ORDER BY user_id',
+                    (self.campaign, question_id)
+                ) as cursor:
+                    return await cursor.fetchall()
+        except Exception as e:
+            logging.error(f"Error getting keyboards for question {question_id}: {e}")
+            raise
+
+    @timed(DB_QUERY_SECONDS, DB_ERRORS)
+    async def delete_keyboards(self, question_id: int, user_ids: List[int]):
+        """Удаление записей о снятых клавиатурах"""
+        try:
+            async with aiosqlite.connect(self.db_name) as db:
+                await db.executemany(
+                    'DELETE FROM keyboards WHERE campaign = ? AND question_id = ? AND user_id = ?',
+                    [(self.campaign, question_id, user_id) for user_id in user_ids]
+                )
+                await db.commit()
+        except Exception as e:
+            logging.error(f"Error deleting keyboards for question {question_id}: {e}")
+            raise
+
+    @timed(DB_QUERY_SECONDS, DB_ERRORS)
+    async def save_broadcast_progress(self, kind: str, item_id: int, last_user_id: Optional[int], finished: bool):
+        """Сохранение прогресса рассылки: последний обработанный получатель и признак завершения"""
+        try:
+            async with aiosqlite.connect(self.db_name) as db:
+                await db.execute(
+                    '''INSERT OR REPLACE INTO broadcasts (campaign, kind, item_id, last_user_id, finished)
+                       VALUES (?, ?, ?, ?, ?)''',
+                    (self.campaign, kind, item_id, last_user_id, finished)
+                )
+                await db.commit()
+        except Exception as e:
+            logging.error(f"Error saving progress of {kind} {item_id}: {e}")
+            raise
+
+    @timed(DB_QUERY_SECONDS, DB_ERRORS)
+    async def get_broadcast_progress(self) -> List[Tuple[str, int, Optional[int], bool]]:
+        """Прогресс рассылок текущей кампании: (kind, item_id, last_user_id, finished)"""
+        try:
+            async with aiosqlite.connect(self.db_name) as db:
+                async with db.execute(
+                    'SELECT kind, item_id, last_user_id, finished FROM broadcasts WHERE campaign = ?',
+                    (self.campaign,)
+                ) as cursor:
+                    return [(kind, item_id, last_user_id, bool(finished))
+                            async for kind, item_id, last_user_id, finished in cursor]
+        except Exception as e:
+            logging.error(f"Error getting broadcast progress: {e}")
+            raise
+
+    @timed(DB_QUERY_SECONDS, DB_ERRORS)
     async def get_user_statistics(self, user_id: int) -> Tuple[int, int]:
         """Получение статистики пользователя (всего ответов, правильных ответов)"""
         try:
@@ -96,25 +256,114 @@ class Database:
                 async with db.execute(
                     '''SELECT COUNT(*) as total, 
                        SUM(CASE WHEN is_correct = 1 THEN 1 ELSE 0 END) as correct 
-                       FROM answers WHERE user_id = ? AND question_id != 999''',
-                    (user_id,)
+                       FROM answers WHERE campaign = ? AND user_id = ? AND question_id != 999''',
+                    (self.campaign, user_id)
                 ) as cursor:
                     result = await cursor.fetchone()
                     return result[0] or 0, result[1] or 0
         except Exception as e:
             logging.error(f"Error getting statistics for user {user_id}: {e}")
+            DB_ERRORS.inc('get_user_statistics')
             return 0, 0
 
-    async def get_all_final_answers(self) -> List[Tuple[int, str, datetime]]:
-        """Получение всех финальных ответов"""
+    @timed(DB_QUERY_SECONDS, DB_ERRORS)
+    async def get_all_final_answers(self, campaign: Optional[str] = None) -> List[Tuple[int, str, datetime]]:
+        """Получение всех финальных ответов текущей или архивной кампании"""
+        campaign = campaign or self.campaign
         try:
+            if campaign != self.campaign:
+                # Завершенные кампании читаются из файла архива
+                async with aiosqlite.connect(f'file:{self.archive_path(campaign)}?mode=ro', uri=True) as db:
+                    async with db.execute(
+                        '''SELECT user_id, answer, answer_time
+                           FROM answers WHERE question_id = 6
+                           ORDER BY answer_time DESC'''
+                    ) as cursor:
+                        return await cursor.fetchall()
+
             async with aiosqlite.connect(self.db_name) as db:
                 async with db.execute(
                     '''SELECT user_id, answer, answer_time 
-                       FROM answers WHERE question_id = 6 
-                       ORDER BY answer_time DESC'''
+                       FROM answers WHERE campaign = ? AND question_id = 6 
+                       ORDER BY answer_time DESC''',
+                    (campaign,)
                 ) as cursor:
                     return await cursor.fetchall()
         except Exception as e:
-            logging.error("Error getting final answers: {e}")
-            return []
\ No newline at end of file
+            logging.error(f"Error getting final answers: {e}")
+            DB_ERRORS.inc('get_all_final_answers')
+            return []
+
+    @timed(DB_QUERY_SECONDS, DB_ERRORS)
+    async def archive_campaign(self, campaign: str) -> int:
+        """Перенос ответов завершенной кампании в отдельный файл архива.
+
+        Архив — компактная база SQLite без служебных колонок и индексов
+        основной базы. В режиме WAL транзакция атомарна только в пределах
+        одного файла, поэтому сначала фиксируется запись в архив, а затем
+        отдельной транзакцией удаляются только те ответы, что уже есть в
+        архиве. Ответы копируются с исходными id, так что повторный запуск
+        после сбоя на любом шаге не создаст дубликатов и не потеряет ответы.
+        """
+        if campaign == self.campaign:
+            raise ValueError(f"Campaign {campaign} is still active")
+
+        path = self.archive_path(campaign)
+        os.makedirs(self.archive_dir, exist_ok=True)
+        try:
+            async with aiosqlite.connect(self.db_name) as db:
+                await db.execute('ATTACH DATABASE ? AS archive', (path,))
+                await db.execute('''
+                    CREATE TABLE IF NOT EXISTS archive.users (
+                        user_id INTEGER PRIMARY KEY,
+                        full_name TEXT NOT NULL,
+                        office TEXT NOT NULL,
+                        registration_date TIMESTAMP
+                    )
+                ''')
+                await db.execute('''
+                    CREATE TABLE IF NOT EXISTS archive.answers (
+                        id INTEGER PRIMARY KEY,
+                        user_id INTEGER,
+                        question_id INTEGER,
+                        answer TEXT,
+                        is_correct BOOLEAN,
+                        answer_time TIMESTAMP
+                    )
+                ''')
+                await db.execute(
+                    '''INSERT OR REPLACE INTO archive.users
+                       SELECT user_id, full_name, office, registration_date FROM main.users
+                       WHERE user_id IN (SELECT user_id FROM main.answers WHERE campaign = ?)''',
+                    (campaign,)
+                )
+                await db.execute(
+                    '''INSERT OR IGNORE INTO archive.answers
+                       SELECT id, user_id, question_id, answer, is_correct, answer_time
+                       FROM main.answers WHERE campaign = ?''',
+                    (campaign,)
+                )
+                await db.commit()
+
+                # Перенесенными считаются удаленные из основной базы: после сбоя
+                # перед удалением ответы уже в архиве, и копирование их не вставит
+                cursor = await db.execute(
+                    '''DELETE FROM main.answers
+                       WHERE campaign = ? AND id IN (SELECT id FROM archive.answers)''',
+                    (campaign,)
+                )
+                moved = cursor.rowcount
+                await db.execute('DELETE FROM main.keyboards WHERE campaign = ?', (campaign,))
+                await db.execute('DELETE FROM main.broadcasts WHERE campaign = ?', (campaign,))
+                await db.commit()
+                await db.execute('DETACH DATABASE archive')
+
+            # Уплотняем файл архива после записи
+            async with aiosqlite.connect(path) as archive:
+                await archive.execute('VACUUM')
+
+            logging.info(f"Archived {moved} answers of campaign {campaign} to {path}")
+            return moved
+        except Exception as e:
+            logging.error(f"Error archiving campaign {campaign}: {e}")
+            raise
@@ -0,0 +1,166 @@
+import asyncio
+import json
+import random
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Set
+
+from aiohttp import web
+
+
+class FakeTelegramServer:
+    """Локальная замена Telegram Bot API для нагрузочного тестирования.
+
+    Реализует getUpdates с long polling и методы отправки сообщений,
+    которые использует бот. Задержка ответа, доля ответов 429 и список
+    пользователей, заблокировавших бота, настраиваются.
+    """
+
+    BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'QuizBot', 'username': 'quiz_bot'}
+
+    def __init__(self, latency: float = 0.05, jitter: float = 0.02, rate_429: float = 0.0,
+                 retry_after: int = 1, blocked_users: Optional[Set[int]] = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_429 = rate_429
+        self.retry_after = retry_after
+        self.blocked_users = blocked_users or set()
+
+        self._updates: List[dict] = []
+        self._next_update_id = 1
+        self._next_message_id = 1
+        self._new_updates = asyncio.Event()
+        self._reply_waiters: Dict[int, List[asyncio.Future]] = defaultdict(list)
+        self._runner: Optional[web.AppRunner] = None
+
+        # Статистика вызовов
+        self.calls: Dict[str, int] = defaultdict(int)
+        self.errors: Dict[int, int] = defaultdict(int)
+        self.received: Dict[int, List[str]] = defaultdict(list)
+
+    async def start(self, host: str = '127.0.0.1', port: int = 8081) -> str:
+        """Запуск сервера, возвращает базовый URL для TelegramAPIServer.from_base"""
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post('/bot{token}/{method}', self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        return f'http://{host}:{port}'
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+    # --- Генерация входящих обновлений ---
+
+    def push_message(self, user_id: int, text: str) -> int:
+        """Добавление текстового сообщения от пользователя"""
+        message = self._message(user_id, text=text)
+        message['from'] = self._user(user_id)
+        return self._push({'message': message})
+
+    def push_callback(self, user_id: int, data: str) -> int:
+        """Добавление нажатия на инлайн-кнопку"""
+        return self._push({'callback_query': {
+            'id': str(self._next_update_id),
+            'from': self._user(user_id),
+            'message': self._message(user_id, text='Выберите ваш ответ:', **{'from': self.BOT_USER}),
+            'chat_instance': str(user_id),
+            'data': data,
+        }})
+
+    def wait_reply(self, user_id: int) -> asyncio.Future:
+        """Future, который завершится при следующем сообщении бота пользователю"""
+        future = asyncio.get_running_loop().create_future()
+        self._reply_waiters[user_id].append(future)
+        return future
+
+    def _push(self, payload: dict) -> int:
+        update_id = self._next_update_id
+        self._next_update_id += 1
+        self._updates.append({'update_id': update_id, **payload})
+        self._new_updates.set()
+        return update_id
+
+    @staticmethod
+    def _user(user_id: int) -> dict:
+        return {'id': user_id, 'is_bot': False, 'first_name': f'User{user_id}'}
+
+    def _message(self, chat_id: int, **fields) -> dict:
+        message_id = self._next_message_id
+        self._next_message_id += 1
+        return {
+            'message_id': message_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            **fields,
+        }
+
+    # --- Обработка запросов бота ---
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info['method']
+        params = dict(await request.post())
+        self.calls[method] += 1
+
+        if method == 'getUpdates':
+            return self._ok(await self._get_updates(params))
+
+        delay = self.latency + random.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        if method in ('getMe', 'deleteWebhook', 'answerCallbackQuery', 'editMessageReplyMarkup'):
+            if method == 'getMe':
+                return self._ok(self.BOT_USER)
+            return self._ok(True)
+
+        if random.random() < self.rate_429:
+            return self._error(429, f'Too Many Requests: retry after {self.retry_after}',
+                               {'retry_after': self.retry_after})
+
+        chat_id = int(params.get('chat_id', 0))
+        if chat_id in self.blocked_users:
+            return self._error(403, 'Forbidden: bot was blocked by the user')
+
+        text = params.get('text') or params.get('caption') or ''
+        message = self._message(chat_id, text=text, **{'from': self.BOT_USER})
+        if method == 'sendPhoto':
+            message['photo'] = [{'file_id': f'photo-{message["message_id"]}', 'file_unique_id': 'p',
+                                 'width': 1, 'height': 1}]
+        elif method == 'sendVideo':
+            message['video'] = {'file_id': f'video-{message["message_id"]}', 'file_unique_id': 'v',
+                                'width': 1, 'height': 1, 'duration': 1}
+
+        self.received[chat_id].append(text)
+        waiters = self._reply_waiters.pop(chat_id, [])
+        for future in waiters:
+            if not future.done():
+                future.set_result(text)
+        return self._ok(message)
+
+    async def _get_updates(self, params: dict) -> List[dict]:
+        offset = int(params.get('offset') or 0)
+        limit = int(params.get('limit') or 100)
+        timeout = float(params.get('timeout') or 0)
+
+        if offset:
+            self._updates = [u for u in self._updates if u['update_id'] >= offset]
+        if not self._updates and timeout:
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(self._new_updates.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self._updates[:limit]
+
+    @staticmethod
+    def _ok(result) -> web.Response:
+        return web.json_response({'ok': True, 'result': result}, dumps=lambda o: json.dumps(o, ensure_ascii=False))
+
+    def _error(self, code: int, description: str, parameters: Optional[dict] = None) -> web.Response:
+        self.errors[code] += 1
+        payload = {'ok': False, 'error_code': code, 'description': description}
+        if parameters:
+            payload['parameters'] = parameters
+        return web.json_response(payload, status=code)
@@ -0,0 +1,97 @@
+import asyncio
+import logging
+import signal
+from typing import Optional
+
+from aiogram import Bot
+from aiohttp import web
+
+from config import SHUTDOWN_TIMEOUT
+from scheduler import Scheduler
+from sharding import ShardedDispatcher
+from utils import notify_admin
+
+
+class Lifecycle:
+    """Запуск и корректная остановка бота.
+
+    По SIGTERM или SIGINT бот перестает получать обновления, дожидается
+    обработки уже полученных, остановки рассылки и закрытия вопросов не
+    дольше timeout секунд, после чего сохраняет состояния FSM и закрывает
+    соединения. Прогресс прерванной рассылки записывается в базу, и после
+    перезапуска планировщик продолжает ее со следующего получателя.
+    """
+
+    def __init__(self, bot: Bot, dp: ShardedDispatcher, scheduler: Scheduler,
+                 metrics_runner: Optional[web.AppRunner] = None, timeout: float = SHUTDOWN_TIMEOUT):
+        self.bot = bot
+        self.dp = dp
+        self.scheduler = scheduler
+        self.metrics_runner = metrics_runner
+        self.timeout = timeout
+        self._stop_requested = asyncio.Event()
+
+    def install_signal_handlers(self):
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, self.request_stop, sig.name)
+
+    def request_stop(self, reason: str = 'request'):
+        if not self._stop_requested.is_set():
+            logging.info(f"Shutdown requested ({reason})")
+            self._stop_requested.set()
+
+    async def run(self):
+        """Работа бота до сигнала остановки"""
+        scheduler_task = asyncio.create_task(self.scheduler.start())
+        polling_task = asyncio.create_task(self.dp.start_polling())
+        stop_task = asyncio.create_task(self._stop_requested.wait())
+        try:
+            await asyncio.wait({polling_task, stop_task}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            stop_task.cancel()
+            await self.shutdown(polling_task, scheduler_task)
+        # Исключение из polling, если он завершился сам
+        if not polling_task.cancelled():
+            polling_task.result()
+
+    async def shutdown(self, polling_task: asyncio.Task, scheduler_task: asyncio.Task):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout
+
+        # Прекращаем прием: текущий getUpdates прерывается, уже полученная
+        # пачка дораспределяется по очередям пользователей
+        self.dp.stop_polling()
+        self.scheduler.stop()
+        await asyncio.wait({polling_task}, timeout=max(0.0, deadline - loop.time()))
+        if not polling_task.done():
+            polling_task.cancel()
+            await asyncio.gather(polling_task, return_exceptions=True)
+
+        # Ждем обработчики полученных обновлений, текущую пачку рассылки и закрытие вопросов
+        drain_task = asyncio.create_task(self.dp.drain())
+        done, pending = await asyncio.wait({drain_task, scheduler_task, *self.scheduler.tasks},
+                                           timeout=max(0.0, deadline - loop.time()))
+        if pending:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            logging.warning(f"Shutdown deadline of {self.timeout}s exceeded, "
+                            f"cancelled {self.dp.cancel()} user queues")
+
+        await notify_admin(self.bot, "🛑 Бот остановлен")
+        await self.close()
+
+    async def close(self):
+        """Сохранение состояний FSM, закрытие соединений и сброс буферов логов"""
+        try:
+            await self.dp.storage.close()
+            await self.dp.storage.wait_closed()
+        except Exception as e:
+            logging.error(f"Error closing FSM storage: {e}")
+        if self.metrics_runner is not None:
+            await self.metrics_runner.cleanup()
+        await (await self.bot.get_session()).close()
+        logging.info("Shutdown complete")
+        for handler in logging.getLogger().handlers:
+            handler.flush()
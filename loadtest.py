@@ -0,0 +1,198 @@
+"""Нагрузочный тест бота на локальной замене Telegram Bot API.
+
+Запускает настоящий диспетчер из bot.py и Scheduler против FakeTelegramServer
+и моделирует утренний пик: N пользователей регистрируются, получают рассылку
+вопроса и отвечают на него текстом или нажатием на кнопку.
+
+    python loadtest.py --users 500 --latency 0.05 --rate-429 0.01 --blocked 0.02
+"""
+import argparse
+import asyncio
+import importlib
+import logging
+import os
+import pathlib
+import random
+import tempfile
+import time
+from datetime import timedelta
+from typing import List
+
+import config
+from fake_telegram import FakeTelegramServer
+
+USER_ID_BASE = 10_000_000
+
+
+def percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+class LoadTest:
+    def __init__(self, args):
+        self.args = args
+        self.latencies = {'start': [], 'registration': [], 'answer': []}
+        self.timeouts = 0
+
+    async def _request(self, kind: str, user_id: int, push, replies: int = 1):
+        """Отправка обновления и ожидание ответов бота с замером задержки до первого"""
+        futures = [self.fake.wait_reply(user_id)]
+        started = time.perf_counter()
+        push()
+        try:
+            await asyncio.wait_for(futures[0], self.args.timeout)
+            self.latencies[kind].append(time.perf_counter() - started)
+            for _ in range(replies - 1):
+                await asyncio.wait_for(self.fake.wait_reply(user_id), self.args.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+
+    async def _wait_state(self, user_id: int, state: str):
+        deadline = time.monotonic() + self.args.timeout
+        while time.monotonic() < deadline:
+            if await self.quizbot.dp.storage.get_state(chat=user_id, user=user_id) == state:
+                return
+            await asyncio.sleep(0.01)
+        self.timeouts += 1
+
+    async def _register(self, user_id: int):
+        await self._request('start', user_id, lambda: self.fake.push_message(user_id, '/start'), replies=3)
+        await self._wait_state(user_id, 'QuizStates:registration')
+        await self._request('registration', user_id,
+                            lambda: self.fake.push_message(user_id, f'Тестов{user_id} Тест Офис{user_id % 7}'))
+        await self._wait_state(user_id, 'QuizStates:answering')
+
+    async def _answer(self, user_id: int, question: dict):
+        guess = random.choice(question.get('options') or [question['correct_answer'], 'не знаю'])
+        if random.random() < self.args.tap_ratio:
+            push = lambda: self.fake.push_callback(user_id, guess)
+        else:
+            push = lambda: self.fake.push_message(user_id, guess)
+        await self._request('answer', user_id, push)
+
+    async def run(self):
+        args = self.args
+        self.fake = FakeTelegramServer(latency=args.latency, jitter=args.latency / 2, rate_429=0.0)
+        url = await self.fake.start(port=args.port)
+
+        # bot.py читает настройки при импорте, поэтому подменяем их заранее
+        config.BOT_TOKEN = '123456:LOADTEST'
+        config.API_SERVER_URL = url
+        self.quizbot = quizbot = importlib.import_module('bot')
+        from questions import QUESTIONS, INFO_POSTS
+        from media import collect_media_paths
+        from scheduler import Scheduler
+        from lifecycle import Lifecycle
+        logging.getLogger().setLevel(logging.WARNING)
+
+        quizbot.db.db_name = args.db
+        quizbot.dp.storage.path = pathlib.Path(args.db).with_suffix('.fsm.json')
+        await quizbot.db.init()
+        await quizbot.registry.load(quizbot.db)
+        await quizbot.media.preload(collect_media_paths(QUESTIONS, INFO_POSTS))
+
+        # Все публикации переносим в будущее, вопрос 1 откроем на этапе пика
+        far = quizbot.get_moscow_time() + timedelta(days=365)
+        for item in QUESTIONS.values():
+            item['start_time'] = item['end_time'] = far
+            item['start_ts'] = item['end_ts'] = far.timestamp()
+        for post in INFO_POSTS.values():
+            post['publish_time'] = far
+
+        polling = asyncio.create_task(quizbot.dp.start_polling(timeout=1, relax=0))
+        users = [USER_ID_BASE + i for i in range(args.users)]
+
+        print(f"Registering {len(users)} users...")
+        started = time.perf_counter()
+        await asyncio.gather(*(self._register(u) for u in users))
+        registration_time = time.perf_counter() - started
+
+        # Пик: открываем вопрос и запускаем настоящий планировщик
+        self.fake.blocked_users = set(random.sample(users, int(len(users) * args.blocked)))
+        self.fake.rate_429 = args.rate_429
+        question = QUESTIONS[1]
+        now = quizbot.get_moscow_time()
+        question['start_time'], question['end_time'] = now, now + timedelta(hours=1)
+        question['start_ts'], question['end_ts'] = now.timestamp() - 1, question['end_time'].timestamp()
+        question['notified'] = False
+
+        print("Broadcasting question 1...")
+        scheduler = Scheduler(quizbot.bot, quizbot.db, quizbot.media, quizbot.registry)
+        scheduler_task = asyncio.create_task(scheduler.start())
+        started = time.perf_counter()
+        while not question['notified']:
+            await asyncio.sleep(0.05)
+        broadcast_time = time.perf_counter() - started
+        delivered = sum(1 for u in users if question['text'] in self.fake.received[u])
+
+        print("Answering...")
+        answering = [u for u in users if u not in self.fake.blocked_users]
+        self.fake.rate_429 = 0.0
+        started = time.perf_counter()
+        await asyncio.gather(*(self._answer(u, question) for u in answering))
+        answer_time = time.perf_counter() - started
+
+        # Закрываем вопрос: снимаем оставшиеся клавиатуры, поздние нажатия отклоняются
+        print("Closing question 1...")
+        question['end_time'] = quizbot.get_moscow_time()
+        question['end_ts'] = question['end_time'].timestamp()
+        started = time.perf_counter()
+        await scheduler._close_question(1)
+        close_time = time.perf_counter() - started
+        stale = random.sample(answering, min(10, len(answering)))
+        calls = dict(self.fake.calls)
+        for user_id in stale:
+            self.fake.push_callback(user_id, question['options'][0])
+        deadline = time.monotonic() + args.timeout
+        while (self.fake.calls['answerCallbackQuery'] - calls.get('answerCallbackQuery', 0) < len(stale) and
+               time.monotonic() < deadline):
+            await asyncio.sleep(0.01)
+        stale_rejected = self.fake.calls['answerCallbackQuery'] - calls.get('answerCallbackQuery', 0)
+        stale_replies = self.fake.calls['sendMessage'] - calls.get('sendMessage', 0)
+
+        # Останавливаемся так же, как бот по SIGTERM
+        started = time.perf_counter()
+        await Lifecycle(quizbot.bot, quizbot.dp, scheduler).shutdown(polling, scheduler_task)
+        shutdown_time = time.perf_counter() - started
+        await self.fake.stop()
+
+        print()
+        print(f"Users:                {len(users)}")
+        print(f"Registration phase:   {registration_time:.2f}s "
+              f"({2 * len(users) / registration_time:.1f} updates/s)")
+        print(f"Answer phase:         {answer_time:.2f}s ({len(answering) / answer_time:.1f} updates/s)")
+        for kind, values in self.latencies.items():
+            print(f"Latency {kind:<13} p50={percentile(values, 0.5) * 1000:.1f}ms "
+                  f"p99={percentile(values, 0.99) * 1000:.1f}ms n={len(values)}")
+        print(f"Broadcast completion: {broadcast_time:.2f}s, delivered {delivered}/{len(users)}")
+        print(f"Close-out:            {close_time:.2f}s, "
+              f"stale taps rejected {stale_rejected}/{len(stale)} with {stale_replies} messages")
+        print(f"Shutdown:             {shutdown_time:.2f}s")
+        print(f"API errors:           429={self.fake.errors[429]} 403={self.fake.errors[403]}")
+        print(f"Timeouts:             {self.timeouts}")
+        print(f"API calls:            {dict(self.fake.calls)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=200, help='количество пользователей')
+    parser.add_argument('--latency', type=float, default=0.05, help='задержка ответа Bot API, с')
+    parser.add_argument('--rate-429', type=float, default=0.0, help='доля ответов 429 во время рассылки')
+    parser.add_argument('--blocked', type=float, default=0.0, help='доля пользователей, заблокировавших бота')
+    parser.add_argument('--tap-ratio', type=float, default=0.5, help='доля ответов нажатием на кнопку')
+    parser.add_argument('--timeout', type=float, default=30.0, help='ожидание ответа бота, с')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--db', default=None, help='путь к базе (по умолчанию временный файл)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.db is None:
+            args.db = os.path.join(tmp, 'loadtest.db')
+        asyncio.run(LoadTest(args).run())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+import asyncio
+import io
+import logging
+import os
+from typing import Dict, Iterable, Optional, Union
+
+from aiogram import types
+from aiogram.types import InputFile
+
+from config import MEDIA_PRELOAD_LIMIT
+
+
+class MediaStore:
+    """Хранилище медиафайлов квиза.
+
+    Небольшие файлы читаются в память при запуске, крупные — в пуле потоков,
+    чтобы не блокировать цикл событий. После первой успешной загрузки
+    Telegram возвращает file_id, и дальше файл отправляется по нему без
+    повторной загрузки.
+    """
+
+    def __init__(self, preload_limit: int = MEDIA_PRELOAD_LIMIT):
+        self.preload_limit = preload_limit
+        self._cache: Dict[str, bytes] = {}
+        self._file_ids: Dict[str, str] = {}
+
+    async def preload(self, paths: Iterable[str]):
+        """Загрузка небольших файлов в память"""
+        loop = asyncio.get_running_loop()
+        for path in set(paths):
+            try:
+                if os.path.getsize(path) > self.preload_limit:
+                    continue
+                self._cache[path] = await loop.run_in_executor(None, self._read, path)
+            except OSError as e:
+                logging.error(f"Failed to preload media {path}: {e}")
+        logging.info(f"Preloaded {len(self._cache)} media files")
+
+    async def get(self, path: str) -> Union[str, InputFile]:
+        """Получение файла для отправки: file_id или буфер с содержимым"""
+        file_id = self._file_ids.get(path)
+        if file_id:
+            return file_id
+
+        data = self._cache.get(path)
+        if data is None:
+            data = await asyncio.get_running_loop().run_in_executor(None, self._read, path)
+        # BytesIO разделяет буфер с bytes до первой записи, копии не создается
+        return InputFile(io.BytesIO(data), filename=os.path.basename(path))
+
+    async def send(self, send_method, path: str, *args, **kwargs) -> types.Message:
+        """Отправка файла методом send_method с запоминанием file_id"""
+        sent = await send_method(*args, await self.get(path), **kwargs)
+        self.remember(path, sent)
+        return sent
+
+    def remember(self, path: str, message: Optional[types.Message]):
+        """Сохранение file_id из ответа Telegram после загрузки файла"""
+        if message is None or path in self._file_ids:
+            return
+        if message.photo:
+            self._file_ids[path] = message.photo[-1].file_id
+        elif message.video:
+            self._file_ids[path] = message.video.file_id
+        else:
+            return
+        # После получения file_id содержимое файла больше не нужно
+        self._cache.pop(path, None)
+
+    @staticmethod
+    def _read(path: str) -> bytes:
+        with open(path, 'rb') as f:
+            return f.read()
+
+
+def collect_media_paths(questions: dict, info_posts: dict) -> list:
+    """Список всех медиафайлов, используемых в вопросах и инфопостах"""
+    paths = ['welcomepicture.jpg']
+    for question in questions.values():
+        for key in ('question_image', 'video_path', 'image_correct'):
+            if key in question:
+                paths.append(question[key])
+    for post in info_posts.values():
+        if 'image_path' in post:
+            paths.append(post['image_path'])
+    return paths
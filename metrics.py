@@ -0,0 +1,173 @@
+import bisect
+import functools
+import logging
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from aiohttp import web
+from aiogram import Bot
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        REGISTRY.append(self)
+
+    def _format_labels(self, values: Tuple[str, ...], extra: str = '') -> str:
+        pairs = [f'{k}="{v}"' for k, v in zip(self.labelnames, values)]
+        if extra:
+            pairs.append(extra)
+        return '{' + ','.join(pairs) + '}' if pairs else ''
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        lines.extend(self.samples())
+        return '\n'.join(lines)
+
+
+class Counter(_Metric):
+    """Монотонно растущий счетчик"""
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, value: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + value
+
+    def samples(self) -> List[str]:
+        return [f'{self.name}{self._format_labels(k)} {v}' for k, v in self._values.items()]
+
+
+class Gauge(_Metric):
+    """Значение, которое может как расти, так и уменьшаться"""
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, *labels: str, value: float):
+        self._values[labels] = value
+
+    def inc(self, *labels: str, value: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + value
+
+    def dec(self, *labels: str, value: float = 1):
+        self.inc(*labels, value=-value)
+
+    def samples(self) -> List[str]:
+        return [f'{self.name}{self._format_labels(k)} {v}' for k, v in self._values.items()]
+
+
+class Histogram(_Metric):
+    """Гистограмма длительностей с фиксированными корзинами"""
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        # Для каждой комбинации меток: счетчики корзин (последняя — +Inf) и сумма
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, *labels: str, value: float):
+        entry = self._values.get(labels)
+        if entry is None:
+            entry = self._values[labels] = ([0] * (len(self.buckets) + 1), [0.0])
+        entry[0][bisect.bisect_left(self.buckets, value)] += 1
+        entry[1][0] += value
+
+    def samples(self) -> List[str]:
+        lines = []
+        for labels, (counts, total) in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                bucket_labels = self._format_labels(labels, f'le="{le}"')
+                lines.append(f'{self.name}_bucket{bucket_labels} {cumulative}')
+            lines.append(f'{self.name}_sum{self._format_labels(labels)} {total[0]}')
+            lines.append(f'{self.name}_count{self._format_labels(labels)} {cumulative}')
+        return lines
+
+
+REGISTRY: List[_Metric] = []
+
+HANDLER_SECONDS = Histogram('quizbot_handler_seconds', 'Handler latency', ['handler'])
+HANDLER_ERRORS = Counter('quizbot_handler_errors_total', 'Unhandled handler exceptions', ['handler'])
+DB_QUERY_SECONDS = Histogram('quizbot_db_query_seconds', 'Database method latency', ['method'])
+DB_ERRORS = Counter('quizbot_db_errors_total', 'Database method exceptions', ['method'])
+API_REQUEST_SECONDS = Histogram('quizbot_api_request_seconds', 'Telegram Bot API request latency', ['method'])
+API_ERRORS = Counter('quizbot_api_errors_total', 'Telegram Bot API errors', ['method', 'error'])
+BROADCAST_MESSAGES = Counter('quizbot_broadcast_messages_total', 'Broadcast deliveries', ['kind', 'status'])
+BROADCAST_SECONDS = Histogram('quizbot_broadcast_seconds', 'Broadcast duration', ['kind'],
+                              buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600))
+BROADCAST_PROGRESS = Gauge('quizbot_broadcast_progress', 'Recipients processed by the current broadcast',
+                           ['kind', 'item'])
+
+
+def render() -> str:
+    """Текстовое представление всех метрик в формате Prometheus"""
+    return '\n'.join(metric.render() for metric in REGISTRY) + '\n'
+
+
+def timed(histogram: Histogram, errors: Optional[Counter] = None):
+    """Декоратор для корутин: замер времени и подсчет исключений по имени функции"""
+    def decorator(func):
+        name = func.__name__
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            except Exception:
+                if errors is not None:
+                    errors.inc(name)
+                raise
+            finally:
+                histogram.observe(name, value=time.perf_counter() - start)
+
+        return wrapper
+
+    return decorator
+
+
+class InstrumentedBot(Bot):
+    """Бот, замеряющий время и ошибки каждого запроса к Bot API"""
+
+    async def request(self, method, data=None, files=None, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await super().request(method, data, files, **kwargs)
+        except Exception as e:
+            API_ERRORS.inc(method, type(e).__name__)
+            raise
+        finally:
+            API_REQUEST_SECONDS.observe(method, value=time.perf_counter() - start)
+
+
+async def _handle_metrics(request: web.Request) -> web.Response:
+    return web.Response(text=render(), content_type='text/plain', charset='utf-8')
+
+
+async def start_metrics_server(host: str, port: int) -> web.AppRunner:
+    """Запуск HTTP-эндпоинта /metrics"""
+    app = web.Application()
+    app.router.add_get('/metrics', _handle_metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logging.info(f"Metrics endpoint listening on http://{host}:{port}/metrics")
+    return runner
@@ -0,0 +1,120 @@
+import logging
+from typing import List, Tuple, Union
+
+import aiosqlite
+
+from config import CAMPAIGN
+
+# SQL-выражение либо пара (выражение, параметры)
+Statement = Union[str, Tuple[str, tuple]]
+
+# Упорядоченный список миграций: (версия, описание, SQL-выражения).
+# Версия схемы хранится в PRAGMA user_version. Уже примененные миграции
+# нельзя менять — любое изменение схемы добавляется новой миграцией в конец.
+MIGRATIONS: List[Tuple[int, str, List[Statement]]] = [
+    (1, 'Базовые таблицы users и answers', [
+        '''
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            full_name TEXT NOT NULL,
+            office TEXT NOT NULL,
+            registration_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS answers (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            question_id INTEGER,
+            answer TEXT,
+            is_correct BOOLEAN,
+            answer_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (user_id)
+        )
+        ''',
+    ]),
+    (2, 'Индексы для проверки ответа пользователя и выборки ответов по вопросу', [
+        'CREATE INDEX IF NOT EXISTS idx_answers_user_question ON answers (user_id, question_id)',
+        'CREATE INDEX IF NOT EXISTS idx_answers_question_time ON answers (question_id, answer_time)',
+    ]),
+    (3, 'Кампания у ответов: существующие ответы относятся к текущей кампании', [
+        'ALTER TABLE answers ADD COLUMN campaign TEXT',
+        ('UPDATE answers SET campaign = ? WHERE campaign IS NULL', (CAMPAIGN,)),
+        'DROP INDEX IF EXISTS idx_answers_user_question',
+        'DROP INDEX IF EXISTS idx_answers_question_time',
+        'CREATE INDEX idx_answers_campaign_user_question ON answers (campaign, user_id, question_id)',
+        'CREATE INDEX idx_answers_campaign_question_time ON answers (campaign, question_id, answer_time)',
+    ]),
+    (4, 'Список сотрудников для регистрации по совпадению с ним', [
+        '''
+        CREATE TABLE roster (
+            id INTEGER PRIMARY KEY,
+            full_name TEXT NOT NULL,
+            name_key TEXT NOT NULL,
+            office TEXT NOT NULL
+        )
+        ''',
+        'CREATE INDEX idx_roster_name_key ON roster (name_key)',
+    ]),
+    (5, 'Отправленные клавиатуры с вариантами ответа для снятия после закрытия вопроса', [
+        '''
+        CREATE TABLE keyboards (
+            campaign TEXT NOT NULL,
+            question_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            message_id INTEGER NOT NULL,
+            PRIMARY KEY (campaign, question_id, user_id)
+        ) WITHOUT ROWID
+        ''',
+    ]),
+    (6, 'Прогресс рассылок для продолжения после перезапуска', [
+        '''
+        CREATE TABLE broadcasts (
+            campaign TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            item_id INTEGER NOT NULL,
+            last_user_id INTEGER,
+            finished BOOLEAN NOT NULL DEFAULT 0,
+            PRIMARY KEY (campaign, kind, item_id)
+        ) WITHOUT ROWID
+        ''',
+    ]),
+]
+
+
+async def get_version(db: aiosqlite.Connection) -> int:
+    async with db.execute('PRAGMA user_version') as cursor:
+        return (await cursor.fetchone())[0]
+
+
+async def apply_migrations(db: aiosqlite.Connection) -> int:
+    """Применение недостающих миграций, каждая в отдельной транзакции.
+
+    BEGIN IMMEDIATE сразу берет блокировку записи, поэтому два процесса не
+    применят одну миграцию дважды. В режиме WAL построение индекса не
+    блокирует читателей, ждут только запросы на запись.
+    """
+    version = await get_version(db)
+    for target, description, statements in MIGRATIONS:
+        if target <= version:
+            continue
+        await db.execute('BEGIN IMMEDIATE')
+        try:
+            # Повторная проверка под блокировкой: миграцию мог применить другой процесс
+            if await get_version(db) >= target:
+                await db.rollback()
+                version = await get_version(db)
+                continue
+            logging.info(f"Applying migration {target}: {description}")
+            for statement in statements:
+                if isinstance(statement, tuple):
+                    await db.execute(*statement)
+                else:
+                    await db.execute(statement)
+            await db.execute(f'PRAGMA user_version = {target}')
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            raise
+        version = target
+    return version
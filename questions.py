@@ -143,6 +143,9 @@ def initialize_times():
     for q_id, times in question_schedule.items():
         questions[q_id]['start_time'] = moscow_tz.localize(datetime.strptime(times['start'], '%Y-%m-%d %H:%M'))
         questions[q_id]['end_time'] = moscow_tz.localize(datetime.strptime(times['end'], '%Y-%m-%d %H:%M'))
+        # Границы окна в UNIX time для быстрой проверки времени ответа
+        questions[q_id]['start_ts'] = questions[q_id]['start_time'].timestamp()
+        questions[q_id]['end_ts'] = questions[q_id]['end_time'].timestamp()
         questions[q_id]['notified'] = False
 
     # Применяем расписание к инфопостам
@@ -0,0 +1,101 @@
+import logging
+from array import array
+from bisect import bisect_left
+from typing import Dict, Iterable, Iterator, Optional
+
+from database import Database
+
+
+def _insert(values: array, value: int) -> bool:
+    """Вставка в отсортированный массив, False если значение уже есть"""
+    i = bisect_left(values, value)
+    if i < len(values) and values[i] == value:
+        return False
+    values.insert(i, value)
+    return True
+
+
+def _remove(values: array, value: int):
+    i = bisect_left(values, value)
+    if i < len(values) and values[i] == value:
+        del values[i]
+
+
+def _contains(values: array, value: int) -> bool:
+    i = bisect_left(values, value)
+    return i < len(values) and values[i] == value
+
+
+def difference(left: Iterable[int], right: array) -> Iterator[int]:
+    """Элементы отсортированной последовательности left, которых нет в right"""
+    j, n = 0, len(right)
+    for value in left:
+        while j < n and right[j] < value:
+            j += 1
+        if j == n or right[j] != value:
+            yield value
+
+
+class RecipientRegistry:
+    """Реестр получателей рассылок в памяти.
+
+    Пользователи, участники по офисам и ответившие на каждый вопрос хранятся
+    в отсортированных массивах array('q') — 8 байт на пользователя вместо
+    объекта int в списке. Реестр загружается из базы при запуске и дальше
+    обновляется обработчиками, поэтому рассылки не обращаются к базе.
+    """
+
+    def __init__(self):
+        self._users = array('q')
+        self._offices: Dict[str, array] = {}
+        self._user_office: Dict[int, str] = {}
+        self._answered: Dict[int, array] = {}
+
+    async def load(self, db: Database):
+        """Загрузка реестра из базы"""
+        self._users, self._offices, self._user_office, self._answered = array('q'), {}, {}, {}
+        for user_id, office in await db.get_recipients():
+            self._users.append(user_id)
+            self._offices.setdefault(office, array('q')).append(user_id)
+            self._user_office[user_id] = office
+        for question_id, user_id in await db.get_answered_pairs():
+            self._answered.setdefault(question_id, array('q')).append(user_id)
+        logging.info(f"Recipient registry loaded: {len(self._users)} users, {len(self._offices)} offices")
+
+    def add_user(self, user_id: int, office: str):
+        """Добавление пользователя или смена его офиса при повторной регистрации"""
+        previous = self._user_office.get(user_id)
+        if previous == office:
+            return
+        if previous is not None:
+            _remove(self._offices[previous], user_id)
+        _insert(self._users, user_id)
+        _insert(self._offices.setdefault(office, array('q')), user_id)
+        self._user_office[user_id] = office
+
+    def mark_answered(self, user_id: int, question_id: int):
+        _insert(self._answered.setdefault(question_id, array('q')), user_id)
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+    def __contains__(self, user_id: int) -> bool:
+        return _contains(self._users, user_id)
+
+    def everyone(self) -> array:
+        """Снимок всех пользователей; копия массива защищает рассылку от вставок во время обхода"""
+        return array('q', self._users)
+
+    def in_office(self, office: str) -> array:
+        return array('q', self._offices.get(office, ()))
+
+    def not_answered(self, question_id: int, office: Optional[str] = None) -> Iterator[int]:
+        """Пользователи (всего или одного офиса), еще не ответившие на вопрос"""
+        recipients = self.in_office(office) if office is not None else self.everyone()
+        return difference(recipients, self.answered(question_id))
+
+    def has_answered(self, user_id: int, question_id: int) -> bool:
+        return _contains(self._answered.get(question_id, ()), user_id)
+
+    def answered(self, question_id: int) -> array:
+        return array('q', self._answered.get(question_id, ()))
@@ -0,0 +1,158 @@
+"""Список сотрудников для регистрации участников.
+
+Импорт из CSV с колонками full_name и office (разделитель — запятая или точка
+с запятой):
+
+    python roster.py employees.csv
+
+Повторный импорт полностью заменяет список. Запущенный бот подхватывает
+новый список по команде /reload_roster.
+"""
+import argparse
+import asyncio
+import csv
+import difflib
+import logging
+import re
+from collections import defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+
+from database import Database
+
+FUZZY_CUTOFF = 0.8
+PREFIX_LENGTH = 3
+
+
+def normalize(text: str) -> str:
+    """Ключ для сравнения: нижний регистр, ё→е, без знаков препинания, слова по алфавиту"""
+    words = re.findall(r'\w+', text.lower().replace('ё', 'е'))
+    return ' '.join(sorted(words))
+
+
+def _similarity(words: List[str], other: List[str]) -> float:
+    """Похожесть двух имен пословно, независимо от порядка слов"""
+    if len(words) != len(other):
+        return 0.0
+    total = 0.0
+    for word in words:
+        total += max(difflib.SequenceMatcher(None, word, candidate).ratio() for candidate in other)
+    return total / len(words)
+
+
+class Roster:
+    """Индекс сотрудников в памяти для поиска при регистрации.
+
+    Точное совпадение ищется по нормализованному ключу имени. Для опечаток
+    кандидаты отбираются по первым буквам слов и сравниваются через difflib,
+    поэтому поиск не перебирает весь список. Офисы приводятся к написанию из
+    списка сотрудников.
+    """
+
+    def __init__(self):
+        self._by_key: Dict[str, List[Tuple[str, str]]] = {}
+        self._by_prefix: Dict[str, Set[str]] = defaultdict(set)
+        self._offices: Dict[str, str] = {}
+
+    async def load(self, db: Database):
+        self._by_key, self._by_prefix, self._offices = {}, defaultdict(set), {}
+        for full_name, name_key, office in await db.get_roster():
+            # Участники часто пишут только фамилию и имя, без отчества
+            keys = {name_key, normalize(' '.join(full_name.split()[:2]))}
+            for key in keys:
+                self._by_key.setdefault(key, []).append((full_name, office))
+                for word in key.split():
+                    self._by_prefix[word[:PREFIX_LENGTH]].add(key)
+            self._offices[normalize(office)] = office
+        if self._by_key:
+            logging.info(f"Roster loaded: {len(self._by_key)} names, {len(self._offices)} offices")
+
+    def __bool__(self) -> bool:
+        return bool(self._by_key)
+
+    def match_office(self, text: str) -> Optional[str]:
+        """Офис в написании из списка сотрудников"""
+        key = normalize(text)
+        if key in self._offices:
+            return self._offices[key]
+        close = difflib.get_close_matches(key, self._offices.keys(), n=1, cutoff=FUZZY_CUTOFF)
+        return self._offices[close[0]] if close else None
+
+    def _match_name(self, key: str) -> Optional[str]:
+        """Ключ имени из списка; None, если похожих нет или два кандидата похожи одинаково"""
+        if key in self._by_key:
+            return key
+        words = key.split()
+        candidates = set()
+        for word in words:
+            candidates |= self._by_prefix.get(word[:PREFIX_LENGTH], set())
+
+        best, best_score, tie = None, FUZZY_CUTOFF, False
+        for candidate in sorted(candidates):
+            score = _similarity(words, candidate.split())
+            if score > best_score or (best is None and score == best_score):
+                best, best_score, tie = candidate, score, False
+            elif best is not None and score == best_score:
+                tie = True
+        return None if tie else best
+
+    @staticmethod
+    def _pick(employees: List[Tuple[str, str]], office: Optional[str]) -> Optional[Tuple[str, str]]:
+        """Единственный сотрудник с этим именем; однофамильцы различаются по офису"""
+        if len(employees) == 1:
+            return employees[0]
+        matches = [employee for employee in employees if employee[1] == office]
+        return matches[0] if len(matches) == 1 else None
+
+    def match(self, text: str) -> Optional[Tuple[str, str]]:
+        """Поиск сотрудника по строке «Фамилия Имя [Отчество] [Офис]», возвращает (ФИО, офис).
+
+        None означает, что участника нужно переспросить: имя не найдено,
+        одинаково похоже на несколько имен или однофамильцев не различить по офису.
+        """
+        key = normalize(text)
+        if key in self._by_key:
+            return self._pick(self._by_key[key], None)
+
+        words = text.split()
+        if len(words) > 1:
+            name_key = self._match_name(normalize(' '.join(words[:-1])))
+            if name_key is not None:
+                # Имя нашлось без последнего слова — это офис, а не часть имени
+                return self._pick(self._by_key[name_key], self.match_office(words[-1]))
+
+        name_key = self._match_name(key)
+        return self._pick(self._by_key[name_key], None) if name_key is not None else None
+
+
+def read_csv(path: str) -> List[Tuple[str, str, str]]:
+    """Чтение CSV со списком сотрудников в строки для Database.import_roster"""
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        dialect = csv.Sniffer().sniff(f.read(4096), delimiters=',;')
+        f.seek(0)
+        rows = []
+        for row in csv.DictReader(f, dialect=dialect):
+            full_name = ' '.join(row['full_name'].split())
+            office = ' '.join(row['office'].split())
+            if full_name and office:
+                rows.append((full_name, normalize(full_name), office))
+        return rows
+
+
+async def import_csv(path: str, db: Database) -> int:
+    await db.init()
+    return await db.import_roster(read_csv(path))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('csv', help='CSV со списком сотрудников')
+    parser.add_argument('--db', default='quiz.db', help='путь к базе')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    count = asyncio.run(import_csv(args.csv, Database(args.db)))
+    print(f"Imported {count} employees")
+
+
+if __name__ == '__main__':
+    main()
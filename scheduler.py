@@ -1,20 +1,37 @@
 from aiogram import Bot
+from aiogram.utils.exceptions import RetryAfter, MessageNotModified, MessageToEditNotFound
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from database import Database
+from media import MediaStore
+from registry import RecipientRegistry
+from config import CLOSE_OUT_RATE, BROADCAST_BATCH_SIZE
+from metrics import BROADCAST_MESSAGES, BROADCAST_SECONDS, BROADCAST_PROGRESS
 from questions import QUESTIONS, INFO_POSTS
 from utils import notify_admin, get_moscow_time
 import asyncio
+import time
+from bisect import bisect_right
+from array import array
 from datetime import datetime
+from typing import Optional, Set
 import pytz
 import logging
 
 
 class Scheduler:
-    def __init__(self, bot: Bot, db: Database):
+    def __init__(self, bot: Bot, db: Database, media: MediaStore, registry: RecipientRegistry):
         self.bot = bot
         self.db = db
+        self.media = media
+        self.registry = registry
         self.running = True
+        self._stopped = asyncio.Event()
+        # Фоновые задачи закрытия вопросов; Lifecycle дожидается их при остановке
+        self.tasks: Set[asyncio.Task] = set()
+        self._closing: Set[int] = set()
+        # Последний получатель прерванных рассылок: (вид, id) -> user_id
+        self._resume = {}
         self.moscow_tz = pytz.timezone('Europe/Moscow')
         self.last_log_time = datetime.now(self.moscow_tz)
         logging.info("Scheduler initialized")
@@ -22,6 +39,7 @@ class Scheduler:
     async def start(self):
         """Запуск планировщика"""
         logging.info("Schedule loop is starting...")
+        await self._load_progress()
         try:
             while self.running:
                 current_time = datetime.now(self.moscow_tz)
@@ -34,10 +52,8 @@ class Scheduler:
                     logging.info(f"=== Scheduler check at {current_time} ===")
                     self.last_log_time = current_time
 
-                # Проверяем количество пользователей
-                users = await self.db.get_all_users()
                 if should_log:
-                    logging.info(f"Total registered users: {len(users)}")
+                    logging.info(f"Total registered users: {len(self.registry)}")
 
                 # Проверяем вопросы
                 for q_id, question in QUESTIONS.items():
@@ -54,7 +70,9 @@ class Scheduler:
                         # Дополнительная проверка - отправляем, только если текущее время после start_time
                         if current_time >= question['start_time']:
                             logging.info(f"Time to send question {q_id}!")
-                            await self._send_question(q_id)
+                            if not await self._send_question(q_id):
+                                # Рассылка прервана остановкой бота и продолжится после перезапуска
+                                continue
                             question['notified'] = True
                             logging.info(f"Question {q_id} marked as notified")
 
@@ -64,6 +82,15 @@ class Scheduler:
                                                f"Время публикации: {current_time.strftime('%Y-%m-%d %H:%M:%S')}\n"
                                                f"Время окончания: {question['end_time'].strftime('%Y-%m-%d %H:%M:%S')}")
 
+                    # После окончания приема ответов снимаем клавиатуры с вариантами.
+                    # Обход занимает долго, поэтому идет в отдельной задаче и не задерживает рассылки
+                    if (current_time > question['end_time'] and not question.get('closed', False)
+                            and q_id not in self._closing and self.running):
+                        self._closing.add(q_id)
+                        task = asyncio.create_task(self._run_close_out(q_id))
+                        self.tasks.add(task)
+                        task.add_done_callback(self.tasks.discard)
+
                 # Проверяем инфопосты
                 for post_id, post in INFO_POSTS.items():
                     if should_log:
@@ -76,7 +103,8 @@ class Scheduler:
                     if (current_time >= post['publish_time'] and
                             not post.get('notified', False)):
                         logging.info(f"Time to send info post {post_id}!")
-                        await self._send_info_post(post_id)
+                        if not await self._send_info_post(post_id):
+                            continue
                         post['notified'] = True
                         logging.info(f"Info post {post_id} marked as notified")
 
@@ -85,48 +113,98 @@ class Scheduler:
                                            f"📢 Опубликован инфопост {post_id}\n"
                                            f"Время публикации: {current_time.strftime('%Y-%m-%d %H:%M:%S')}")
 
-                # Увеличиваем интервал проверки до 30 секунд, так как у нас фиксированное расписание
-                await asyncio.sleep(30)
+                # Увеличиваем интервал проверки до 30 секунд, так как у нас фиксированное расписание.
+                # Ожидание прерывается остановкой планировщика
+                try:
+                    await asyncio.wait_for(self._stopped.wait(), timeout=30)
+                except asyncio.TimeoutError:
+                    pass
 
         except Exception as e:
             logging.error(f"Error in schedule loop: {e}", exc_info=True)
             await notify_admin(self.bot, f"❌ Ошибка в планировщике: {e}")
 
-    async def _send_question(self, question_id: int):
-        """Отправка вопроса всем пользователям"""
+    def stop(self):
+        """Остановка планировщика: текущая рассылка прерывается после очередного получателя"""
+        self.running = False
+        self._stopped.set()
+
+    async def _load_progress(self):
+        """Восстановление прогресса рассылок после перезапуска"""
+        try:
+            for kind, item_id, last_user_id, finished in await self.db.get_broadcast_progress():
+                items = QUESTIONS if kind == 'question' else INFO_POSTS
+                if item_id not in items:
+                    continue
+                if finished:
+                    items[item_id]['notified'] = True
+                elif last_user_id is not None:
+                    self._resume[(kind, item_id)] = last_user_id
+                    logging.info(f"Broadcast of {kind} {item_id} will resume after user {last_user_id}")
+        except Exception as e:
+            logging.error(f"Error loading broadcast progress: {e}")
+
+    def _recipients(self, kind: str, item_id: int) -> array:
+        """Получатели рассылки; прерванная рассылка продолжается со следующего пользователя"""
+        users = self.registry.everyone()
+        last_user_id = self._resume.pop((kind, item_id), None)
+        if last_user_id is not None:
+            users = users[bisect_right(users, last_user_id):]
+        return users
+
+    async def _checkpoint(self, kind: str, item_id: int, last_user_id: Optional[int], finished: bool,
+                          keyboards: Optional[list] = None):
+        """Запись отправленных клавиатур и прогресса рассылки; ошибка записи не прерывает рассылку"""
         try:
-            users = await self.db.get_all_users()
+            if keyboards:
+                await self.db.save_keyboards(keyboards)
+            await self.db.save_broadcast_progress(kind, item_id, last_user_id, finished)
+        except Exception as e:
+            logging.error(f"Failed to checkpoint {kind} {item_id}: {e}")
+
+    async def _send_question(self, question_id: int) -> bool:
+        """Отправка вопроса всем пользователям, False если рассылка прервана остановкой"""
+        started = time.perf_counter()
+        keyboards = []
+        last_user_id = None
+        interrupted = False
+        try:
+            users = self._recipients('question', question_id)
             question = QUESTIONS[question_id]
 
             logging.info(f"Sending question {question_id} to {len(users)} users")
 
-            for user_id in users:
+            for sent_count, user_id in enumerate(users, 1):
+                if not self.running:
+                    interrupted = True
+                    logging.info(f"Question {question_id} broadcast interrupted after user {last_user_id}")
+                    break
                 try:
                     logging.info(f"Sending to user {user_id}")
 
                     # Отправляем медиа контент
                     if 'question_image' in question:
                         try:
-                            with open(question['question_image'], 'rb') as photo:
-                                await self.bot.send_photo(
-                                    user_id,
-                                    photo,
-                                    caption=question['text']
-                                )
-                                logging.info(f"Sent photo to user {user_id}")
+                            await self.media.send(
+                                self.bot.send_photo,
+                                question['question_image'],
+                                user_id,
+                                caption=question['text']
+                            )
+                            logging.info(f"Sent photo to user {user_id}")
                         except Exception as e:
                             logging.error(f"Failed to send photo, sending text only: {e}")
                             await self.bot.send_message(user_id, question['text'])
 
                     elif 'video_path' in question:
                         try:
-                            with open(question['video_path'], 'rb') as video:
-                                await self.bot.send_video(
-                                    user_id,
-                                    video,
-                                    caption=question['text']
-                                )
-                                logging.info(f"Sent video to user {user_id}")
+                            await self.media.send(
+                                self.bot.send_video,
+                                question['video_path'],
+                                user_id,
+                                caption=question['text']
+                            )
+                            logging.info(f"Sent video to user {user_id}")
                         except Exception as e:
                             logging.error(f"Failed to send video, sending text only: {e}")
                             await self.bot.send_message(user_id, question['text'])
@@ -140,47 +218,154 @@ class Scheduler:
                         keyboard = InlineKeyboardMarkup()
                         for option in question['options']:
                             keyboard.add(InlineKeyboardButton(text=option, callback_data=option))
-                        await self.bot.send_message(
+                        sent = await self.bot.send_message(
                             user_id,
                             "Выберите ваш ответ:",
                             reply_markup=keyboard
                         )
                         logging.info(f"Sent inline keyboard to user {user_id}")
 
+                        # Запоминаем сообщение, чтобы снять клавиатуру после закрытия вопроса
+                        keyboards.append((user_id, question_id, sent.message_id))
+
                     # Информация о подсказке для второго вопроса
                     if question_id == 2:
                         hint_info = f"Подсказка будет доступна через {question['hint_delay'] // 60} минут. Используйте команду /hint для её получения."
                         await self.bot.send_message(user_id, hint_info)
                         logging.info(f"Sent hint info to user {user_id}")
 
+                    BROADCAST_MESSAGES.inc('question', 'ok')
+
                     # Добавляем небольшую задержку между отправками разным пользователям
                     await asyncio.sleep(0.1)
 
                 except Exception as e:
+                    BROADCAST_MESSAGES.inc('question', 'error')
                     logging.error(f"Error sending to user {user_id}: {e}", exc_info=True)
                     await notify_admin(self.bot, f"❌ Ошибка отправки вопроса {question_id} пользователю {user_id}: {e}")
 
+                BROADCAST_PROGRESS.set('question', str(question_id), value=sent_count)
+                last_user_id = user_id
+                if sent_count % BROADCAST_BATCH_SIZE == 0:
+                    await self._checkpoint('question', question_id, last_user_id, False, keyboards)
+                    keyboards = []
+
+        except asyncio.CancelledError:
+            # Отмена по истечении времени на остановку — рассылка не завершена
+            interrupted = True
+            raise
         except Exception as e:
             logging.error(f"Error in _send_question: {e}", exc_info=True)
             await notify_admin(self.bot, f"❌ Критическая ошибка при отправке вопроса {question_id}: {e}")
+        finally:
+            if last_user_id is not None or not interrupted:
+                await self._checkpoint('question', question_id, last_user_id, not interrupted, keyboards)
+            BROADCAST_SECONDS.observe('question', value=time.perf_counter() - started)
+        return not interrupted
 
-    async def _send_info_post(self, post_id: int):
-        """Отправка информационного поста всем пользователям"""
+    async def _run_close_out(self, question_id: int):
         try:
-            users = await self.db.get_all_users()
+            if await self._close_question(question_id):
+                QUESTIONS[question_id]['closed'] = True
+        finally:
+            self._closing.discard(question_id)
+
+    async def _paced_call(self, method, *args, **kwargs):
+        """Вызов Bot API не чаще CLOSE_OUT_RATE раз в секунду с одним повтором после 429"""
+        for attempt in range(2):
+            try:
+                return await method(*args, **kwargs)
+            except RetryAfter as e:
+                if attempt:
+                    raise
+                await asyncio.sleep(e.timeout)
+            finally:
+                await asyncio.sleep(1 / CLOSE_OUT_RATE)
+
+    async def _close_keyboard(self, user_id: int, message_id: int, notice: Optional[str]):
+        """Снятие клавиатуры и уведомление о закрытии вопроса"""
+        try:
+            await self._paced_call(self.bot.edit_message_reply_markup, user_id, message_id, reply_markup=None)
+        except (MessageNotModified, MessageToEditNotFound):
+            # Клавиатура уже снята или сообщение удалено пользователем
+            pass
+        if notice:
+            await self._paced_call(self.bot.send_message, user_id, notice)
+
+    async def _close_question(self, question_id: int) -> bool:
+        """Снятие клавиатур вопроса после окончания приема ответов, False если прервано остановкой.
+
+        Клавиатуры снимаются пачками не быстрее CLOSE_OUT_RATE запросов в
+        секунду, записи о снятых удаляются после каждой пачки, поэтому после
+        перезапуска обход продолжается с места остановки. Уведомление о
+        закрытии получают только те, кто не успел ответить.
+        """
+        started = time.perf_counter()
+        interrupted = False
+        closed = []
+        try:
+            keyboards = await self.db.get_keyboards(question_id)
+            if not keyboards:
+                return True
+            logging.info(f"Closing question {question_id}: removing {len(keyboards)} keyboards")
+            notice = f"Прием ответов на вопрос {question_id} завершен."
+
+            for start in range(0, len(keyboards), BROADCAST_BATCH_SIZE):
+                for user_id, message_id in keyboards[start:start + BROADCAST_BATCH_SIZE]:
+                    if not self.running:
+                        interrupted = True
+                        break
+                    try:
+                        answered = self.registry.has_answered(user_id, question_id)
+                        await self._close_keyboard(user_id, message_id, None if answered else notice)
+                        BROADCAST_MESSAGES.inc('close_out', 'ok')
+                    except Exception as e:
+                        BROADCAST_MESSAGES.inc('close_out', 'error')
+                        logging.error(f"Error closing keyboard for user {user_id}: {e}")
+                    closed.append(user_id)
+                await self.db.delete_keyboards(question_id, closed)
+                removed, closed = start + len(closed), []
+                BROADCAST_PROGRESS.set('close_out', str(question_id), value=removed)
+                if interrupted:
+                    logging.info(f"Closing question {question_id} interrupted, {removed} keyboards removed")
+                    return False
+
+            await notify_admin(self.bot, f"🔒 Вопрос {question_id} закрыт, снято клавиатур: {len(keyboards)}")
+        except Exception as e:
+            logging.error(f"Error in _close_question: {e}", exc_info=True)
+            await notify_admin(self.bot, f"❌ Ошибка при закрытии вопроса {question_id}: {e}")
+        finally:
+            # При отмене удаляем записи уже снятых клавиатур текущей пачки,
+            # иначе после перезапуска эти пользователи получат уведомление повторно
+            if closed:
+                await self.db.delete_keyboards(question_id, closed)
+            BROADCAST_SECONDS.observe('close_out', value=time.perf_counter() - started)
+        return True
+
+    async def _send_info_post(self, post_id: int) -> bool:
+        """Отправка информационного поста всем пользователям, False если рассылка прервана остановкой"""
+        started = time.perf_counter()
+        last_user_id = None
+        interrupted = False
+        try:
+            users = self._recipients('info_post', post_id)
             post = INFO_POSTS[post_id]
             logging.info(f"Sending info post {post_id} to {len(users)} users")
 
-            for user_id in users:
+            for sent_count, user_id in enumerate(users, 1):
+                if not self.running:
+                    interrupted = True
+                    logging.info(f"Info post {post_id} broadcast interrupted after user {last_user_id}")
+                    break
                 try:
                     logging.info(f"Sending to user {user_id}")
 
                     # Если есть картинка, отправляем ее с текстом в качестве подписи
                     if 'image_path' in post:
                         try:
-                            with open(post['image_path'], 'rb') as photo:
-                                await self.bot.send_photo(user_id, photo, caption=post['text'])
-                                logging.info(f"Sent photo with caption to user {user_id}")
+                            await self.media.send(self.bot.send_photo, post['image_path'], user_id,
+                                                  caption=post['text'])
+                            logging.info(f"Sent photo with caption to user {user_id}")
                         except Exception as e:
                             logging.error(f"Failed to send photo with caption: {e}")
                             await self.bot.send_message(user_id, post['text'])
@@ -188,13 +373,29 @@ class Scheduler:
                         await self.bot.send_message(user_id, post['text'])
                         logging.info(f"Sent text to user {user_id}")
 
+                    BROADCAST_MESSAGES.inc('info_post', 'ok')
+
                     # Добавляем небольшую задержку между отправками разным пользователям
                     await asyncio.sleep(0.1)
 
                 except Exception as e:
+                    BROADCAST_MESSAGES.inc('info_post', 'error')
                     logging.error(f"Error sending info post to user {user_id}: {e}")
                     await notify_admin(self.bot, f"❌ Ошибка отправки инфопоста {post_id} пользователю {user_id}: {e}")
 
+                BROADCAST_PROGRESS.set('info_post', str(post_id), value=sent_count)
+                last_user_id = user_id
+                if sent_count % BROADCAST_BATCH_SIZE == 0:
+                    await self._checkpoint('info_post', post_id, last_user_id, False)
+
+        except asyncio.CancelledError:
+            interrupted = True
+            raise
         except Exception as e:
             logging.error(f"Error in _send_info_post: {e}")
-            await notify_admin(self.bot, f"❌ Критическая ошибка при отправке инфопоста {post_id}: {e}")
\ No newline at end of file
+            await notify_admin(self.bot, f"❌ Критическая ошибка при отправке инфопоста {post_id}: {e}")
+        finally:
+            if last_user_id is not None or not interrupted:
+                await self._checkpoint('info_post', post_id, last_user_id, not interrupted)
+            BROADCAST_SECONDS.observe('info_post', value=time.perf_counter() - started)
+        return not interrupted
\ No newline at end of file
@@ -0,0 +1,198 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Set, Tuple
+
+import aiohttp
+from aiohttp.helpers import sentinel
+from aiogram import Bot, Dispatcher, types
+
+from config import DISPATCH_WORKERS, DISPATCH_USER_QUEUE_SIZE, DISPATCH_MAX_PENDING
+from metrics import Counter, Gauge, Histogram
+from utils import update_received_at
+
+DISPATCH_PENDING = Gauge('quizbot_dispatch_pending_updates', 'Updates queued or being processed')
+DISPATCH_USERS = Gauge('quizbot_dispatch_active_users', 'Users with queued updates')
+DISPATCH_DROPPED = Counter('quizbot_dispatch_dropped_total', 'Updates dropped because a user queue was full')
+DISPATCH_WAIT_SECONDS = Histogram('quizbot_dispatch_queue_wait_seconds', 'Time an update spent in the user queue')
+DISPATCH_POLLING_STALLS = Counter('quizbot_dispatch_polling_stalls_total',
+                                  'Update batches that held back getUpdates until queue capacity was freed')
+
+UPDATE_USER_FIELDS = ('message', 'edited_message', 'callback_query', 'inline_query', 'chosen_inline_result',
+                      'shipping_query', 'pre_checkout_query', 'my_chat_member', 'chat_member', 'chat_join_request')
+
+
+def update_user_id(update: types.Update) -> Optional[int]:
+    """Идентификатор пользователя, от которого пришло обновление"""
+    for field in UPDATE_USER_FIELDS:
+        obj = getattr(update, field)
+        if obj is not None and obj.from_user is not None:
+            return obj.from_user.id
+    return None
+
+
+class ShardedDispatcher(Dispatcher):
+    """Диспетчер с очередью обновлений на каждого пользователя.
+
+    Обновления одного пользователя обрабатываются строго по порядку, поэтому
+    двойное нажатие на кнопку не проходит проверку ответа дважды. Разные
+    пользователи обрабатываются параллельно, не более workers одновременно.
+    Очередь пользователя ограничена user_queue_size — лишние обновления
+    отбрасываются; общее число ожидающих ограничено max_pending. Пачка
+    обновлений распределяется по очередям прямо в цикле long polling, поэтому
+    при заполнении следующий getUpdates ждет освобождения места, а новые
+    обновления остаются на стороне Telegram.
+    """
+
+    def __init__(self, *args, workers: int = DISPATCH_WORKERS, user_queue_size: int = DISPATCH_USER_QUEUE_SIZE,
+                 max_pending: int = DISPATCH_MAX_PENDING, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.user_queue_size = user_queue_size
+        self._queues: Dict[int, Deque[Tuple[types.Update, float]]] = {}
+        self._workers = asyncio.Semaphore(workers)
+        self._capacity = asyncio.Semaphore(max_pending)
+        self._tasks: Set[asyncio.Task] = set()
+        self._get_updates: Optional[asyncio.Task] = None
+
+    async def start_polling(self, timeout=20, relax=0.1, limit=None, reset_webhook=None, fast: bool = True,
+                            error_sleep: int = 5, allowed_updates: Optional[List[str]] = None):
+        """Long polling, как в Dispatcher.start_polling, но пачка обрабатывается в самом цикле.
+
+        Dispatcher.start_polling запускает обработку каждой пачки отдельной
+        задачей и сразу запрашивает следующую, так что при заполненных
+        очередях пачки копились бы в памяти без ограничения.
+        """
+        if self._polling:
+            raise RuntimeError('Polling already started')
+        logging.info('Start polling.')
+        Dispatcher.set_current(self)
+        Bot.set_current(self.bot)
+
+        if reset_webhook is None:
+            await self.reset_webhook(check=False)
+        if reset_webhook:
+            await self.reset_webhook(check=True)
+
+        self._polling = True
+        offset = None
+        try:
+            current_request_timeout = self.bot.timeout
+            if current_request_timeout is not sentinel and timeout is not None:
+                request_timeout = aiohttp.ClientTimeout(total=current_request_timeout.total + timeout or 1)
+            else:
+                request_timeout = None
+
+            while self._polling:
+                self._get_updates = asyncio.create_task(
+                    self._fetch_updates(request_timeout, limit, offset, timeout, allowed_updates))
+                try:
+                    updates = await self._get_updates
+                    # Время получения всей пачки: ожидание места в очередях его не сдвигает
+                    received_at = time.time()
+                except asyncio.CancelledError:
+                    break
+                except Exception:
+                    logging.exception('Cause exception while getting updates.')
+                    await asyncio.sleep(error_sleep)
+                    continue
+                finally:
+                    self._get_updates = None
+
+                if updates:
+                    offset = updates[-1].update_id + 1
+                    # Ожидание места в очередях задерживает следующий getUpdates
+                    await self.process_updates(updates, fast, received_at)
+
+                if relax:
+                    await asyncio.sleep(relax)
+        finally:
+            self._close_waiter.set_result(None)
+            logging.warning('Polling is stopped.')
+
+    async def _fetch_updates(self, request_timeout, limit, offset, timeout, allowed_updates) -> List[types.Update]:
+        with self.bot.request_timeout(request_timeout):
+            return await self.bot.get_updates(limit=limit, offset=offset, timeout=timeout,
+                                              allowed_updates=allowed_updates)
+
+    def stop_polling(self):
+        """Остановка long polling без ожидания таймаута текущего getUpdates.
+
+        Уже полученная пачка дораспределяется по очередям; неподтвержденные
+        обновления Telegram отдаст снова после перезапуска.
+        """
+        super().stop_polling()
+        if self._get_updates is not None:
+            self._get_updates.cancel()
+
+    async def process_updates(self, updates, fast: bool = True, received_at: Optional[float] = None):
+        """Распределение обновлений по очередям пользователей без ожидания обработки.
+
+        received_at — время получения пачки от Telegram, по умолчанию текущее.
+        """
+        if received_at is None:
+            received_at = time.time()
+        stalled = False
+        for update in updates:
+            if self._capacity.locked():
+                stalled = True
+            await self.submit(update, received_at)
+        if stalled:
+            DISPATCH_POLLING_STALLS.inc()
+        return []
+
+    async def submit(self, update: types.Update, received_at: float):
+        user_id = update_user_id(update)
+        queue = self._queues.get(user_id)
+        if queue is not None and len(queue) >= self.user_queue_size:
+            DISPATCH_DROPPED.inc()
+            logging.warning(f"Update {update.update_id} from user {user_id} dropped: queue is full")
+            return
+
+        await self._capacity.acquire()
+        DISPATCH_PENDING.inc()
+        # Пока ждали места, обработчик очереди пользователя мог завершиться
+        queue = self._queues.get(user_id)
+        if queue is None:
+            queue = self._queues[user_id] = deque()
+            DISPATCH_USERS.inc()
+            self._spawn(self._run_user(user_id, queue))
+        queue.append((update, received_at))
+
+    async def drain(self):
+        """Ожидание обработки всех обновлений, уже распределенных по очередям"""
+        while self._tasks:
+            await asyncio.wait(self._tasks)
+
+    def cancel(self) -> int:
+        """Отмена обработки оставшихся обновлений, возвращает число отмененных очередей"""
+        for task in self._tasks:
+            task.cancel()
+        return len(self._tasks)
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run_user(self, user_id: Optional[int], queue: Deque[Tuple[types.Update, float]]):
+        try:
+            while queue:
+                update, received_at = queue[0]
+                async with self._workers:
+                    DISPATCH_WAIT_SECONDS.observe(value=time.time() - received_at)
+                    try:
+                        # Отдельная задача: фильтры aiogram кэшируют состояние в контексте задачи
+                        await asyncio.create_task(self._process(update, received_at))
+                    except Exception:
+                        logging.exception(f"Error processing update {update.update_id}")
+                queue.popleft()
+                self._capacity.release()
+                DISPATCH_PENDING.dec()
+        finally:
+            del self._queues[user_id]
+            DISPATCH_USERS.dec()
+
+    async def _process(self, update: types.Update, received_at: float):
+        update_received_at.set(received_at)
+        return await self.updates_handler.notify(update)
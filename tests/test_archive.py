@@ -0,0 +1,78 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+from database import Database
+
+
+@pytest.fixture
+def dbs(tmp_path):
+    path = str(tmp_path / 'quiz.db')
+    archive_dir = str(tmp_path / 'archive')
+    old = Database(path, campaign='old', archive_dir=archive_dir)
+    new = Database(path, campaign='new', archive_dir=archive_dir)
+    asyncio.run(old.init())
+    asyncio.run(old.register_user(1, 'Участник', 'Офис'))
+    asyncio.run(old.save_answers([(1, question_id, 'чай', True) for question_id in range(1, 6)]))
+    asyncio.run(new.save_answer(1, 1, 'чай', True))
+    return old, new
+
+
+def count_answers(path, campaign=None):
+    with sqlite3.connect(path) as conn:
+        if campaign is None:
+            return conn.execute('SELECT COUNT(*) FROM answers').fetchone()[0]
+        return conn.execute('SELECT COUNT(*) FROM answers WHERE campaign = ?', (campaign,)).fetchone()[0]
+
+
+def test_archive_moves_only_finished_campaign(dbs):
+    old, new = dbs
+
+    assert asyncio.run(new.archive_campaign('old')) == 5
+
+    assert count_answers(new.db_name, 'old') == 0
+    assert count_answers(new.db_name, 'new') == 1
+    assert count_answers(new.archive_path('old')) == 5
+
+
+def test_repeated_archive_moves_only_new_answers(dbs):
+    old, new = dbs
+    asyncio.run(new.archive_campaign('old'))
+    asyncio.run(old.save_answer(1, 6, 'чай', True))
+
+    assert asyncio.run(new.archive_campaign('old')) == 1
+    assert count_answers(new.archive_path('old')) == 6
+    assert count_answers(new.db_name, 'old') == 0
+
+
+def test_archive_resumes_after_crash_before_delete(dbs):
+    old, new = dbs
+    asyncio.run(new.archive_campaign('old'))
+    asyncio.run(old.save_answers([(1, question_id, 'чай', True) for question_id in range(6, 9)]))
+    # Сбой после фиксации архива: ответы скопированы, но не удалены из основной базы
+    with sqlite3.connect(new.db_name) as conn:
+        conn.execute('ATTACH DATABASE ? AS archive', (new.archive_path('old'),))
+        conn.execute("""INSERT INTO archive.answers
+                        SELECT id, user_id, question_id, answer, is_correct, answer_time
+                        FROM main.answers WHERE campaign = 'old'""")
+
+    assert asyncio.run(new.archive_campaign('old')) == 3
+    assert count_answers(new.archive_path('old')) == 8
+    assert count_answers(new.db_name, 'old') == 0
+    assert count_answers(new.db_name, 'new') == 1
+
+
+def test_archive_rejects_active_campaign(dbs):
+    old, new = dbs
+    with pytest.raises(ValueError):
+        asyncio.run(new.archive_campaign('new'))
+
+
+@pytest.mark.parametrize('campaign', ['../x', '../../x', 'a/b', '..', ''])
+def test_archive_rejects_path_outside_archive_dir(dbs, campaign):
+    old, new = dbs
+
+    with pytest.raises(ValueError):
+        asyncio.run(new.archive_campaign(campaign))
+    assert count_answers(new.db_name) == 6
@@ -0,0 +1,76 @@
+import asyncio
+import importlib
+import socket
+import sqlite3
+
+import pytest
+
+import config
+from fake_telegram import FakeTelegramServer
+
+QUESTION_ID = 1
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def quizbot(tmp_path, monkeypatch):
+    """Модуль bot, подключенный к FakeTelegramServer, с открытым вопросом 1"""
+    # bot.py при импорте создает лог сообщений и файл состояний в текущем каталоге
+    monkeypatch.chdir(tmp_path)
+    port = free_port()
+    monkeypatch.setattr(config, 'BOT_TOKEN', '123456:TEST')
+    monkeypatch.setattr(config, 'API_SERVER_URL', f'http://127.0.0.1:{port}')
+    bot = importlib.reload(importlib.import_module('bot'))
+    bot.db.db_name = str(tmp_path / 'quiz.db')
+    bot.port = port
+
+    question = bot.QUESTIONS[QUESTION_ID]
+    now = bot.get_moscow_time().timestamp()
+    monkeypatch.setitem(question, 'start_ts', now - 60)
+    monkeypatch.setitem(question, 'end_ts', now + 3600)
+    return bot
+
+
+async def drain(bot, setup):
+    fake = FakeTelegramServer(latency=0.0, jitter=0.0)
+    await fake.start(port=bot.port)
+    try:
+        await bot.db.init()
+        await bot.db.register_user(1, 'Участник', 'Офис')
+        await bot.registry.load(bot.db)
+        await setup(bot, fake)
+        await bot.drain_backlog()
+        await bot.dp.drain()
+    finally:
+        await (await bot.bot.get_session()).close()
+        await fake.stop()
+
+
+def saved_answers(bot):
+    with sqlite3.connect(bot.db.db_name) as conn:
+        return conn.execute('SELECT user_id, question_id, answer FROM answers').fetchall()
+
+
+def test_answer_saved_without_stored_state(quizbot):
+    # Первый запуск или аварийная остановка: файла состояний нет
+    async def setup(bot, fake):
+        fake.push_message(1, 'Чай')
+
+    asyncio.run(drain(quizbot, setup))
+
+    assert saved_answers(quizbot) == [(1, QUESTION_ID, 'чай')]
+
+
+def test_registration_text_is_not_an_answer(quizbot):
+    async def setup(bot, fake):
+        await bot.dp.storage.set_state(chat=1, user=1, state=bot.QuizStates.registration.state)
+        fake.push_message(1, 'Иванов Иван Офис')
+
+    asyncio.run(drain(quizbot, setup))
+
+    assert saved_answers(quizbot) == []
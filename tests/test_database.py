@@ -0,0 +1,20 @@
+import asyncio
+
+import pytest
+
+from database import Database
+from metrics import DB_ERRORS
+
+
+@pytest.mark.parametrize('method, args', [
+    ('get_all_users', ()),
+    ('check_if_answered', (1, 1)),
+    ('get_user_statistics', (1,)),
+    ('get_all_final_answers', ()),
+])
+def test_swallowed_errors_are_counted(tmp_path, method, args):
+    # База без миграций: в ней нет таблиц, и любой запрос завершается ошибкой
+    db = Database(str(tmp_path / 'empty.db'))
+    before = DB_ERRORS._values.get((method,), 0)
+    asyncio.run(getattr(db, method)(*args))
+    assert DB_ERRORS._values.get((method,), 0) == before + 1
@@ -0,0 +1,83 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+from config import CAMPAIGN
+from database import Database
+from migrations import MIGRATIONS
+
+# Схема базы до появления миграций: таблицы создавались в Database.init
+OLD_SCHEMA = '''
+    CREATE TABLE users (
+        user_id INTEGER PRIMARY KEY,
+        full_name TEXT NOT NULL,
+        office TEXT NOT NULL,
+        registration_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE TABLE answers (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        question_id INTEGER,
+        answer TEXT,
+        is_correct BOOLEAN,
+        answer_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users (user_id)
+    );
+'''
+
+USERS = 20
+ANSWERS_PER_USER = 5
+
+
+@pytest.fixture
+def old_db(tmp_path):
+    path = str(tmp_path / 'quiz.db')
+    with sqlite3.connect(path) as conn:
+        conn.executescript(OLD_SCHEMA)
+        conn.executemany('INSERT INTO users (user_id, full_name, office) VALUES (?, ?, ?)',
+                         [(user_id, f'Участник {user_id}', f'Офис {user_id % 3}') for user_id in range(USERS)])
+        conn.executemany('INSERT INTO answers (user_id, question_id, answer, is_correct) VALUES (?, ?, ?, ?)',
+                         [(user_id, question_id, 'чай', question_id % 2)
+                          for user_id in range(USERS) for question_id in range(1, ANSWERS_PER_USER + 1)])
+    return path
+
+
+def schema(path):
+    with sqlite3.connect(path) as conn:
+        return conn.execute('SELECT type, name, sql FROM sqlite_master ORDER BY name').fetchall()
+
+
+def test_migrates_populated_old_database(old_db):
+    asyncio.run(Database(old_db).init())
+
+    with sqlite3.connect(old_db) as conn:
+        assert conn.execute('PRAGMA user_version').fetchone()[0] == MIGRATIONS[-1][0]
+        assert conn.execute('SELECT COUNT(*) FROM users').fetchone()[0] == USERS
+        assert conn.execute('SELECT COUNT(*) FROM answers').fetchone()[0] == USERS * ANSWERS_PER_USER
+        assert conn.execute('SELECT DISTINCT campaign FROM answers').fetchall() == [(CAMPAIGN,)]
+        indexes = {name for name, in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+
+    assert {'idx_answers_campaign_user_question', 'idx_answers_campaign_question_time',
+            'idx_roster_name_key'} <= indexes
+    assert not {'idx_answers_user_question', 'idx_answers_question_time'} & indexes
+
+
+def test_repeated_init_is_noop(old_db):
+    asyncio.run(Database(old_db).init())
+    migrated = schema(old_db)
+
+    asyncio.run(Database(old_db).init())
+
+    assert schema(old_db) == migrated
+    with sqlite3.connect(old_db) as conn:
+        assert conn.execute('PRAGMA user_version').fetchone()[0] == MIGRATIONS[-1][0]
+        assert conn.execute('SELECT COUNT(*) FROM answers').fetchone()[0] == USERS * ANSWERS_PER_USER
+
+
+def test_migrated_database_serves_queries(old_db):
+    db = Database(old_db)
+    asyncio.run(db.init())
+
+    assert asyncio.run(db.check_if_answered(1, 1))
+    assert asyncio.run(db.get_user_statistics(1)) == (ANSWERS_PER_USER, 3)
@@ -0,0 +1,102 @@
+import asyncio
+import random
+from array import array
+
+import pytest
+
+from registry import RecipientRegistry, difference
+
+OFFICES = ['Осень', 'Весна', 'Зима']
+QUESTIONS = range(1, 4)
+
+
+class FakeDatabase:
+    """Источник данных для RecipientRegistry.load в порядке, который отдает база"""
+
+    def __init__(self, users, answered):
+        self.users = users
+        self.answered = answered
+
+    async def get_recipients(self):
+        return sorted(self.users.items())
+
+    async def get_answered_pairs(self):
+        return sorted(self.answered)
+
+
+@pytest.fixture
+def state():
+    """Реестр и та же информация в виде обычных множеств"""
+    rnd = random.Random(0)
+    users = {user_id: rnd.choice(OFFICES) for user_id in rnd.sample(range(1, 500), 100)}
+    answered = {(question_id, user_id) for user_id in users for question_id in QUESTIONS if rnd.random() < 0.5}
+    registry = RecipientRegistry()
+    asyncio.run(registry.load(FakeDatabase(users, answered)))
+    return registry, users, answered, rnd
+
+
+def assert_matches(registry, users, answered):
+    assert list(registry.everyone()) == sorted(users)
+    assert len(registry) == len(users)
+    for office in OFFICES + ['Лето']:
+        office_users = {user_id for user_id, user_office in users.items() if user_office == office}
+        assert list(registry.in_office(office)) == sorted(office_users)
+        for question_id in QUESTIONS:
+            answered_users = {user_id for q_id, user_id in answered if q_id == question_id}
+            assert list(registry.answered(question_id)) == sorted(answered_users)
+            assert list(registry.not_answered(question_id)) == sorted(set(users) - answered_users)
+            assert list(registry.not_answered(question_id, office)) == sorted(office_users - answered_users)
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_difference_matches_set_difference(seed):
+    rnd = random.Random(seed)
+    left = sorted(rnd.sample(range(100), rnd.randint(0, 50)))
+    right = array('q', sorted(rnd.sample(range(100), rnd.randint(0, 50))))
+
+    assert list(difference(left, right)) == sorted(set(left) - set(right))
+
+
+def test_loaded_registry_matches_sets(state):
+    assert_matches(*state[:3])
+
+
+def test_updates_match_sets(state):
+    registry, users, answered, rnd = state
+    for _ in range(300):
+        user_id = rnd.randint(1, 600)
+        if rnd.random() < 0.5:
+            # Новые пользователи, повторная регистрация и смена офиса
+            office = rnd.choice(OFFICES + ['Лето'])
+            registry.add_user(user_id, office)
+            users[user_id] = office
+        else:
+            # В том числе повторная отметка уже ответившего
+            question_id = rnd.choice(QUESTIONS)
+            registry.mark_answered(user_id, question_id)
+            answered.add((question_id, user_id))
+
+    assert_matches(registry, users, answered)
+
+
+def test_office_change_moves_user(state):
+    registry, users, answered, _ = state
+    user_id = next(iter(users))
+    office = next(office for office in OFFICES if office != users[user_id])
+
+    registry.add_user(user_id, office)
+    users[user_id] = office
+
+    assert_matches(registry, users, answered)
+
+
+def test_duplicate_mark_answered(state):
+    registry, users, answered, _ = state
+    question_id, user_id = next(iter(answered))
+
+    registry.mark_answered(user_id, question_id)
+    registry.mark_answered(user_id, question_id)
+
+    assert list(registry.answered(question_id)).count(user_id) == 1
+    assert registry.has_answered(user_id, question_id)
+    assert_matches(registry, users, answered)
@@ -0,0 +1,66 @@
+import asyncio
+
+import pytest
+
+from database import Database
+from roster import Roster, normalize
+
+EMPLOYEES = [
+    ('Петров Петр Петрович', 'Осень'),
+    ('Иванов Иван Петрович', 'Осень'),
+    ('Иванов Иван Сергеевич', 'Весна'),
+    ('Котов Олег Ильич', 'Весна'),
+    ('Ротов Олег Ильич', 'Осень'),
+]
+
+
+@pytest.fixture(scope='module')
+def roster(tmp_path_factory):
+    db = Database(str(tmp_path_factory.mktemp('roster') / 'quiz.db'))
+    roster = Roster()
+
+    async def load():
+        await db.init()
+        await db.import_roster([(full_name, normalize(full_name), office) for full_name, office in EMPLOYEES])
+        await roster.load(db)
+
+    asyncio.run(load())
+    return roster
+
+
+@pytest.mark.parametrize('text, expected', [
+    # Точное совпадение, с офисом и без
+    ('Петров Петр Петрович Осень', ('Петров Петр Петрович', 'Осень')),
+    ('петров петр петрович', ('Петров Петр Петрович', 'Осень')),
+    ('Петрович Петров Петр', ('Петров Петр Петрович', 'Осень')),
+    # Без отчества
+    ('Петров Петр Осень', ('Петров Петр Петрович', 'Осень')),
+    ('Петров Петр', ('Петров Петр Петрович', 'Осень')),
+    # Опечатка в имени и в офисе
+    ('Петрв Петр Осень', ('Петров Петр Петрович', 'Осень')),
+    ('Иванов Иван Осен', ('Иванов Иван Петрович', 'Осень')),
+    # Однофамильцы различаются по офису или отчеству
+    ('Иванов Иван Осень', ('Иванов Иван Петрович', 'Осень')),
+    ('Иванов Иван Весна', ('Иванов Иван Сергеевич', 'Весна')),
+    ('Иванов Иван Сергеевич', ('Иванов Иван Сергеевич', 'Весна')),
+])
+def test_match(roster, text, expected):
+    assert roster.match(text) == expected
+
+
+@pytest.mark.parametrize('text', [
+    # Офис не из списка не различает однофамильцев и не считается частью имени
+    'Иванов Иван Зима',
+    'Иванов Иван',
+    # Одинаково похоже на Котова и Ротова
+    'Лотов Олег Ильич',
+    'Сидоров Семен Осень',
+])
+def test_ambiguous_or_unknown(roster, text):
+    assert roster.match(text) is None
+
+
+def test_match_office(roster):
+    assert roster.match_office('осень') == 'Осень'
+    assert roster.match_office('Весн') == 'Весна'
+    assert roster.match_office('Зима') is None
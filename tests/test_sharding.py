@@ -0,0 +1,38 @@
+import asyncio
+import time
+
+from aiogram import Bot, types
+
+from sharding import ShardedDispatcher
+from utils import callback_timestamp
+
+
+def make_update(update_id, user_id):
+    return types.Update.to_object({
+        'update_id': update_id,
+        'message': {'message_id': update_id, 'date': int(time.time()), 'text': 'ответ',
+                    'chat': {'id': user_id, 'type': 'private'},
+                    'from': {'id': user_id, 'is_bot': False, 'first_name': 'Тест'}},
+    })
+
+
+def test_batch_keeps_receipt_time_under_backpressure():
+    async def run():
+        bot = Bot(token='123456:TEST')
+        dp = ShardedDispatcher(bot, workers=1, max_pending=1)
+        stamps = []
+
+        @dp.message_handler()
+        async def handler(message: types.Message):
+            await asyncio.sleep(0.05)
+            stamps.append(callback_timestamp())
+
+        received_at = time.time() - 10
+        # Места хватает на одно обновление, остальные ждут освобождения очереди
+        await dp.process_updates([make_update(i, i) for i in range(1, 4)], received_at=received_at)
+        await dp.drain()
+        await (await bot.get_session()).close()
+        return received_at, stamps
+
+    received_at, stamps = asyncio.run(run())
+    assert stamps == [received_at] * 3
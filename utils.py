@@ -1,8 +1,17 @@
-from aiogram import Bot
+from aiogram import Bot, types
+from aiogram.dispatcher.middlewares import BaseMiddleware
 import logging
-from config import ADMIN_IDS
+from config import ADMIN_IDS, TIMEZONE
 import pytz
+import time
+from contextvars import ContextVar
 from datetime import datetime
+from typing import Optional, Tuple
+
+moscow_tz = pytz.timezone(TIMEZONE)
+
+# Время получения обрабатываемого обновления (UNIX time)
+update_received_at: ContextVar[float] = ContextVar('update_received_at')
 
 async def notify_admin(bot: Bot, message: str):
     """Централизованная функция отправки уведомлений администраторам"""
@@ -14,9 +23,32 @@ async def notify_admin(bot: Bot, message: str):
 
 def get_moscow_time():
     """Получение текущего времени в московской таймзоне"""
-    moscow_tz = pytz.timezone('Europe/Moscow')
     return datetime.now(moscow_tz)
 
+def find_active_question(questions: dict, timestamp: float) -> Tuple[Optional[int], Optional[dict]]:
+    """Поиск вопроса, открытого в момент timestamp (UNIX time)"""
+    for qid, question in questions.items():
+        if question['start_ts'] <= timestamp <= question['end_ts']:
+            return qid, question
+    return None, None
+
+def message_timestamp(message: types.Message) -> float:
+    """Время отправки сообщения пользователем по данным Telegram"""
+    # aiogram переводит date в наивное локальное время, timestamp() возвращает исходное значение
+    return message.date.timestamp()
+
+def callback_timestamp() -> float:
+    """Время получения нажатия на кнопку: Telegram не сообщает время самого нажатия"""
+    return update_received_at.get(time.time())
+
+class ReceiptTimeMiddleware(BaseMiddleware):
+    """Запоминает время получения обновления до его обработки"""
+
+    async def on_pre_process_update(self, update: types.Update, data: dict):
+        # Диспетчер с очередями выставляет время получения сам, до постановки в очередь
+        if update_received_at.get(None) is None:
+            update_received_at.set(time.time())
+
 def is_admin(user_id: int):
     """Проверка является ли пользователь администратором"""
     return user_id in ADMIN_IDS
\ No newline at end of file